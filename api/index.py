@@ -2,20 +2,44 @@ import os
 import re
 import math
 import time
+import csv
+import json
+import zlib
+import sqlite3
+import heapq
+import hashlib
+import sys
+import atexit
+import queue
+import asyncio
 import logging
-from collections import Counter, defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from functools import lru_cache
+import threading
+import multiprocessing
+from array import array
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from typing import Tuple, List
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import aiohttp
 import nltk
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
-import praw
 from dotenv import load_dotenv
 import psutil
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -36,17 +60,25 @@ USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/122.0.2365.66'
 ]
 
-reddit = praw.Reddit(
-    client_id=os.getenv('REDDIT_CLIENT_ID'),
-    client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
-    user_agent="ReddiGist/1.0"
-)
-
 SUBMISSION_ID_REGEX = re.compile(r'/comments/([^/]+)/')
 CLEAN_TEXT_REGEX = re.compile(r'[^a-zA-Z0-9\s]')
 MULTISPACE_REGEX = re.compile(r'\s+')
 NUMERIC_START_REGEX = re.compile(r'^\d+')
 CONNECTING_WORDS_REGEX = re.compile(r'\b(and|or|of|the|in|on|at|to|for|with)\b$', re.IGNORECASE)
+# clean_text output; anything else is tokenized with NLTK even when TOKENIZER_BACKEND is 'fast'
+CLEANED_TEXT_REGEX = re.compile(r'[a-zA-Z0-9\s]*')
+# clean_texts joins a batch with NUL separators, which no cleaning pass may remove or cross.
+# ASCII batches are cleaned with one str.translate (drop punctuation, whitespace to spaces) and
+# only runs of spaces go through a regex; other batches use the regexes minus single spaces.
+TEXT_SEPARATOR = '\x00'
+ASCII_CLEAN_TABLE = str.maketrans({
+    char: (' ' if char.isspace() else None)
+    for char in map(chr, range(128))
+    if not char.isalnum() and char not in (' ', TEXT_SEPARATOR)
+})
+SPACE_RUN_REGEX = re.compile(' {2,}')
+CLEAN_BATCH_REGEX = re.compile(r'[^a-zA-Z0-9\s\x00]')
+MULTISPACE_BATCH_REGEX = re.compile(r'\s{2,}|[^\S ]')
 URL_REGEX = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
 
 MAX_TOTAL_COMMENTS = 5000
@@ -95,123 +127,1192 @@ SPECIAL_PREFIXES = {
     'Part', 'Chapter', 'Book', 'Volume', 'Season', 'Act', 'Phase', 'Episode',
     'Series', 'Section', 'Stage', 'Level', 'Grade', 'Tier', 'Generation'
 }
+SPECIAL_PREFIXES_LOWER = {word.lower() for word in SPECIAL_PREFIXES}
+
+ROMAN_TO_NUM = {'I': '1', 'II': '2', 'III': '3', 'IV': '4', 'V': '5',
+                'VI': '6', 'VII': '7', 'VIII': '8', 'IX': '9', 'X': '10'}
+NUM_TO_ROMAN = {v: k for k, v in ROMAN_TO_NUM.items()}
+ORDINAL_REGEX = re.compile(r'(\d+)(st|nd|rd|th)')
+
+# word_tokenize splits these words (in any casing) even in text without punctuation
+CONTRACTION_SPLITS = {'cannot': 3, 'gimme': 3, 'gonna': 3, 'gotta': 3, 'lemme': 3, 'wanna': 3}
+
+# Per-token bits used by PhraseCounter to validate n-grams without re-inspecting strings
+TOKEN_CUSTOM = 1 << 0
+TOKEN_SHORT = 1 << 1
+TOKEN_STARTER = 1 << 2
+TOKEN_NUMERIC = 1 << 3
+TOKEN_STOPWORD = 1 << 4
+TOKEN_CAPITALIZED = 1 << 5
+TOKEN_I = 1 << 6
+TOKEN_SPECIAL_PREFIX = 1 << 7
+TOKEN_SPECIAL_PREFIX_LOWER = 1 << 8
+TOKEN_CONNECTING = 1 << 9
 
 STATS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'searchstats')
 os.makedirs(STATS_DIR, exist_ok=True)
 STATS_FILE = os.path.join(STATS_DIR, 'performance_metrics.csv')
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+# STATS_FILE is moved to STATS_FILE.1 once it reaches METRICS_MAX_BYTES
+METRICS_MAX_BYTES = int(os.getenv('METRICS_MAX_BYTES', 5 * 1024 * 1024))
+METRICS_WINDOW = 1000
+METRICS_PERCENTILES = (50, 90, 99)
+METRICS_FIELDS = [
+    'timestamp', 'status', 'num_urls', 'top_n', 'min_ngram', 'max_ngram', 'custom_words', 'approximate',
+    'total_comments', 'unexpanded_comments', 'ngrams', 'candidates', 'phrases', 'count_error',
+    'total_time', 'fetch_time', 'slowest_fetch_time', 'clean_time', 'count_time', 'select_time',
+    'extract_time', 'score_time', 'memory_used'
+]
+METRICS_SUMMARY_FIELDS = METRICS_FIELDS[METRICS_FIELDS.index('total_comments'):]
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cache')
+COMMENT_CACHE_ENABLED = os.getenv('COMMENT_CACHE_ENABLED', '1') == '1'
+COMMENT_CACHE_PATH = os.getenv('COMMENT_CACHE_PATH', os.path.join(CACHE_DIR, 'comments.sqlite3'))
+COMMENT_CACHE_MAX_BYTES = int(os.getenv('COMMENT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Finished /api/top_phrases results, keyed by the request parameters and the comment cache
+# snapshot of every thread. The sqlite backend is shared by all worker processes on the machine.
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', '1') == '1'
+RESULT_CACHE_BACKEND = os.getenv('RESULT_CACHE_BACKEND', 'memory')
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', os.path.join(CACHE_DIR, 'results.sqlite3'))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 600))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 512))
+
+# (max thread age in seconds, cache TTL in seconds): young threads change quickly,
+# old ones barely at all. Threads older than the last rule use COMMENT_CACHE_ARCHIVED_TTL.
+COMMENT_CACHE_TTL_RULES = [
+    (60 * 60, 60),
+    (24 * 60 * 60, 5 * 60),
+    (7 * 24 * 60 * 60, 30 * 60),
+    (180 * 24 * 60 * 60, 6 * 60 * 60),
+]
+COMMENT_CACHE_ARCHIVED_TTL = 7 * 24 * 60 * 60
+
+# A stale entry is still served if num_comments moved by less than this
+COMMENT_CACHE_MIN_DELTA = 10
+COMMENT_CACHE_MAX_DELTA_RATIO = 0.02
+
+REDDIT_API_BASE = os.getenv('REDDIT_API_BASE', 'https://oauth.reddit.com')
+REDDIT_AUTH_URL = os.getenv('REDDIT_AUTH_URL', 'https://www.reddit.com/api/v1/access_token')
+REDDIT_USER_AGENT = "ReddiGist/1.0"
+REDDIT_REQUESTS_PER_MINUTE = int(os.getenv('REDDIT_REQUESTS_PER_MINUTE', 100))
+REDDIT_BURST = 10
+REDDIT_BURST_FRACTION = 0.25
+REDDIT_REQUEST_TIMEOUT = 30
+REDDIT_MAX_RETRIES = 3
+FETCH_CONCURRENCY = int(os.getenv('FETCH_CONCURRENCY', 8))
+COMMENT_PAGE_LIMIT = 500
+MORECHILDREN_BATCH_SIZE = 100
+
+# Budget for expanding 'more' stubs per thread; requests beyond the first page run concurrently
+MORE_COMMENTS_CONCURRENCY = FETCH_CONCURRENCY
+MORE_COMMENTS_MAX_REQUESTS = 48
+MORE_COMMENTS_TIME_BUDGET = 25
+
+# Stale snapshots that grew by at most INCREMENTAL_MAX_DELTA comments are refreshed from the
+# newest INCREMENTAL_COMMENT_LIMIT comments instead of refetching the whole thread
+INCREMENTAL_REFRESH = os.getenv('INCREMENTAL_REFRESH', '1') == '1'
+INCREMENTAL_MAX_DELTA = 400
+INCREMENTAL_COMMENT_LIMIT = 500
+
+# Title and comment count of threads, looked up in bulk and reused to revalidate cached comments
+POST_INFO_TTL = int(os.getenv('POST_INFO_TTL', 60))
+POST_INFO_CACHE_MAX_ENTRIES = 1024
+# Reddit's /api/info takes at most this many ids per request
+POST_INFO_BATCH_SIZE = 100
+MAX_POST_INFO_URLS = 500
+
+# 'numpy' scores all comments with array operations; falls back to 'python' if numpy is missing
+SCORING_BACKEND = os.getenv('SCORING_BACKEND', 'numpy')
+DEFAULT_ALPHA = 0.1
+MAX_ALPHAS = 16
+
+# Below this many candidate phrases a str.find per phrase beats a single regex scan of each comment
+PHRASE_MATCHER_MIN_PHRASES = 100
+
+# ContainmentIndex keeps every substring of tokens up to this long (a token has about n^2 / 2)
+# and scans longer ones
+CONTAINMENT_MAX_TOKEN_LENGTH = 32
+
+# 'fast' tokenizes cleaned comments with a whitespace split that matches word_tokenize on them;
+# 'nltk' always uses word_tokenize
+TOKENIZER_BACKEND = os.getenv('TOKENIZER_BACKEND', 'fast')
+
+# Tokenized comments are cached by content hash up to TOKEN_CACHE_MAX_BYTES, either for the
+# process lifetime ('process') or only for the request that tokenized them ('request')
+TOKEN_CACHE_MAX_BYTES = int(os.getenv('TOKEN_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+TOKEN_CACHE_SCOPE = os.getenv('TOKEN_CACHE_SCOPE', 'process')
+
+# Phrase counting and scoring are sharded across EXTRACT_WORKERS processes for batches of at
+# least SHARD_MIN_COMMENTS comments; smaller batches aren't worth the pickling overhead
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', 0))
+SHARD_MIN_COMMENTS = int(os.getenv('SHARD_MIN_COMMENTS', 2000))
+
+# Requests with approximate=true keep at most APPROX_COUNTER_CAPACITY n-gram counts (between
+# prunes up to twice that), so they may analyse up to APPROX_MAX_TOTAL_COMMENTS comments
+APPROX_COUNTER_CAPACITY = int(os.getenv('APPROX_COUNTER_CAPACITY', 50000))
+APPROX_MAX_TOTAL_COMMENTS = int(os.getenv('APPROX_MAX_TOTAL_COMMENTS', 50000))
+
+# Per-thread n-gram counts of every length up to NGRAM_CACHE_MAX_N, reused by requests whatever
+# their n-gram bounds and custom words; bounded by the total number of n-grams kept
+NGRAM_CACHE_ENABLED = os.getenv('NGRAM_CACHE_ENABLED', '1') == '1'
+NGRAM_CACHE_MAX_N = 5
+NGRAM_CACHE_MAX_NGRAMS = int(os.getenv('NGRAM_CACHE_MAX_NGRAMS', 500000))
+# Threads refreshed this many times are recounted from scratch instead of adding another segment
+NGRAM_CACHE_MAX_SEGMENTS = 8
+
+class CommentCache:
+    """On-disk SQLite store of fetched comments keyed by submission ID.
+
+    Entries are fresh for a TTL that grows with the thread's age. Once stale, an entry
+    is revalidated against the live num_comments and only refetched if the thread has
+    grown noticeably. Total payload size is bounded by evicting least recently used entries.
+    """
 
-# def log_performance_metrics(metrics):
-#     """Log performance metrics to Supabase"""
-#     try:
-#         from supabase import create_client
-        
-#         supabase = create_client(
-#             os.getenv('SUPABASE_URL', ''),
-#             os.getenv('SUPABASE_KEY', '')
-#         )
-        
-#         supabase.table('performance_metrics').insert({
-#             'total_comments': metrics['total_comments'],
-#             'num_urls': metrics['num_urls'],
-#             'top_n': metrics['top_n'],
-#             'min_ngram': metrics['min_ngram'],
-#             'max_ngram': metrics['max_ngram'],
-#             'custom_words': metrics['custom_words'],
-#             'total_time': metrics['total_time'],
-#             'fetch_time': metrics['fetch_time'],
-#             'clean_time': metrics['clean_time'],
-#             'extract_time': metrics['extract_time'],
-#             'score_time': metrics['score_time'],
-#             'memory_usage': metrics['memory_used']
-#         }).execute()
-#     except Exception as e:
-#         logger.error(f"Failed to log metrics to Supabase: {e}")
+    def __init__(self, path, max_bytes=COMMENT_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.incremental = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS comments (
+                    submission_id TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    num_comments INTEGER NOT NULL,
+                    created_utc REAL NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    stored_at REAL NOT NULL DEFAULT 0
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(comments)")}
+            if 'stored_at' not in columns:
+                conn.execute("ALTER TABLE comments ADD COLUMN stored_at REAL NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def ttl_for(thread_age):
+        for max_age, ttl in COMMENT_CACHE_TTL_RULES:
+            if thread_age < max_age:
+                return ttl
+        return COMMENT_CACHE_ARCHIVED_TTL
+
+    @staticmethod
+    def is_unchanged(cached_num_comments, num_comments):
+        allowed = max(COMMENT_CACHE_MIN_DELTA, cached_num_comments * COMMENT_CACHE_MAX_DELTA_RATIO)
+        return abs(num_comments - cached_num_comments) <= allowed
+
+    def get(self, submission_id):
+        """Return the cached snapshot for a submission regardless of staleness, or None."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT payload, num_comments, created_utc, fetched_at, stored_at FROM comments "
+                    "WHERE submission_id = ?",
+                    (submission_id,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Comment cache lookup failed for {submission_id}: {e}")
+            row = None
+
+        if row is None:
+            self._count('misses')
+            return None
+
+        payload, num_comments, created_utc, fetched_at, stored_at = row
+        return {
+            'submission_id': submission_id,
+            'comments': json.loads(zlib.decompress(payload)),
+            'num_comments': num_comments,
+            'created_utc': created_utc,
+            'fetched_at': fetched_at,
+            'stored_at': stored_at
+        }
+
+    def version(self, submission_id):
+        """Return when the stored snapshot of a submission was written, or None if there is none
+        or it would have to be revalidated before being served."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT created_utc, fetched_at, stored_at FROM comments WHERE submission_id = ?",
+                    (submission_id,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Comment cache lookup failed for {submission_id}: {e}")
+            return None
+        if row is None or self.is_expired({'created_utc': row[0], 'fetched_at': row[1]}):
+            return None
+        return row[2]
+
+    def is_expired(self, snapshot):
+        now = time.time()
+        return now - snapshot['fetched_at'] > self.ttl_for(now - snapshot['created_utc'])
+
+    def is_fresh(self, snapshot, num_comments=None):
+        """Check whether a snapshot can be served as-is.
+
+        num_comments is the thread's live comment count and only needed once is_expired().
+        """
+        now = time.time()
+        revalidated = self.is_expired(snapshot)
+
+        if revalidated and not self.is_unchanged(snapshot['num_comments'], num_comments):
+            self._count('misses')
+            return False
+
+        try:
+            with self._connect() as conn:
+                if revalidated:
+                    conn.execute("UPDATE comments SET fetched_at = ? WHERE submission_id = ?",
+                                 (now, snapshot['submission_id']))
+                conn.execute("UPDATE comments SET accessed_at = ? WHERE submission_id = ?",
+                             (now, snapshot['submission_id']))
+        except sqlite3.Error as e:
+            logger.warning(f"Comment cache update failed for {snapshot['submission_id']}: {e}")
+        self._count('revalidated' if revalidated else 'hits')
+        return True
+
+    def store(self, submission_id, comments, num_comments, created_utc, incremental=False):
+        """Write a snapshot and return its version (see version()), or None if it was not stored."""
+        if incremental:
+            self._count('incremental')
+        payload = zlib.compress(json.dumps(comments).encode('utf-8'))
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO comments (submission_id, payload, size, num_comments, created_utc, "
+                    "fetched_at, accessed_at, stored_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (submission_id, payload, len(payload), num_comments, created_utc, now, now, now)
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Comment cache store failed for {submission_id}: {e}")
+            return None
+        return now
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM comments").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for submission_id, size in conn.execute(
+            "SELECT submission_id, size FROM comments ORDER BY accessed_at ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM comments WHERE submission_id = ?", (submission_id,))
+            total -= size
+            self._count('evictions')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'incremental': self.incremental,
+                'evictions': self.evictions
+            }
+
+comment_cache = CommentCache(COMMENT_CACHE_PATH) if COMMENT_CACHE_ENABLED else None
+
+class ResultCache:
+    """In-process LRU cache whose entries expire after a TTL, e.g. of /api/top_phrases results."""
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(params, versions):
+        """Hash of the normalized request parameters and the snapshot version of each thread."""
+        payload = json.dumps({'params': params, 'versions': versions}, sort_keys=True, separators=(',', ':'))
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+class SharedResultCache(ResultCache):
+    """ResultCache kept in a SQLite file, so the worker processes of a server share their results."""
+
+    def __init__(self, path, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL):
+        super().__init__(max_entries, ttl)
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value FROM results WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+            row = None
+        self._count('misses' if row is None else 'hits')
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(value), now + self.ttl, now))
+                conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM results WHERE key NOT IN (SELECT key FROM results ORDER BY accessed_at DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache store failed: {e}")
+
+if not RESULT_CACHE_ENABLED:
+    result_cache = None
+elif RESULT_CACHE_BACKEND == 'sqlite':
+    result_cache = SharedResultCache(RESULT_CACHE_PATH)
+else:
+    result_cache = ResultCache()
+
+def thread_versions(submission_ids):
+    """Snapshot version of each thread for result cache keys, or None if any would be refetched.
+
+    Without the comment cache there are no snapshots, and cached results are only bounded by the TTL.
+    """
+    if not comment_cache:
+        return [None] * len(submission_ids)
+    versions = [comment_cache.version(submission_id) for submission_id in submission_ids]
+    return None if None in versions else versions
+
+_fetch_loop = None
+_fetch_loop_lock = threading.Lock()
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+
+class RequestMetrics:
+    """Stage timings and counters of one /api/top_phrases request, flattened into a STATS_FILE row.
+
+    span(name) adds the time spent in its block to spans[name], and iter_reddit_data records the
+    fetch time of each URL in fetch_times.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.fields = {}
+        self.spans = defaultdict(float)
+        self.counters = Counter()
+        self.fetch_times = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.spans[name] += time.time() - start
+
+    def row(self, status):
+        row = {'timestamp': f'{self.start:.3f}', 'status': status, **self.fields, **self.counters}
+        for name, seconds in self.spans.items():
+            row[f'{name}_time'] = f'{seconds:.4f}'
+        row.setdefault('total_time', f'{time.time() - self.start:.4f}')
+        row['slowest_fetch_time'] = f'{max(self.fetch_times.values(), default=0):.4f}'
+        return row
+
+@contextmanager
+def metrics_file_lock():
+    """Hold the lock on STATS_FILE shared by every thread and worker process on the machine."""
+    with _metrics_lock, open(STATS_FILE + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def log_performance_metrics(metrics):
+    """Append a row of request metrics to STATS_FILE, rotating the file once it is full."""
+    if not METRICS_ENABLED:
+        return
+    try:
+        with metrics_file_lock():
+            if os.path.exists(STATS_FILE) and os.path.getsize(STATS_FILE) >= METRICS_MAX_BYTES:
+                os.replace(STATS_FILE, STATS_FILE + '.1')
+            new_file = not os.path.exists(STATS_FILE) or os.path.getsize(STATS_FILE) == 0
+            with open(STATS_FILE, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=METRICS_FIELDS, extrasaction='ignore')
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(metrics)
+    except OSError as e:
+        logger.error(f"Failed to log performance metrics: {e}")
+
+def read_performance_metrics(limit=METRICS_WINDOW):
+    """Return the last limit rows logged, reaching into the rotated file if needed."""
+    rows = deque(maxlen=limit)
+    try:
+        with metrics_file_lock():
+            for path in (STATS_FILE + '.1', STATS_FILE):
+                try:
+                    with open(path, newline='') as f:
+                        rows.extend(csv.DictReader(f))
+                except FileNotFoundError:
+                    continue
+    except OSError as e:
+        logger.error(f"Failed to read performance metrics: {e}")
+    return list(rows)
+
+def percentile(sorted_values, q):
+    """Nearest-rank q-th percentile of a non-empty sorted list."""
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+def metric_value(value):
+    """A logged metric as a float, or None if it is missing or malformed."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+def summarize_metrics(rows):
+    """Percentiles and maximum of every numeric metric over rows, skipping malformed values."""
+    summary = {}
+    for field in METRICS_SUMMARY_FIELDS:
+        values = sorted(value for value in (metric_value(row.get(field)) for row in rows) if value is not None)
+        if values:
+            summary[field] = {f'p{q}': percentile(values, q) for q in METRICS_PERCENTILES}
+            summary[field]['max'] = values[-1]
+    return summary
 
 def get_submission_id(url):
     match = SUBMISSION_ID_REGEX.search(url)
     return match.group(1) if match else None
 
-def get_reddit_data(url, max_comments=10000, timeout=300):
-    """Get Reddit data using official API within free tier limits"""
+class RateLimitScheduler:
+    """Thread-safe scheduler shared by every request to Reddit.
+
+    Callers reserve() a slot under one lock before each request, so the fetches of
+    concurrent Flask requests are queued in arrival order. Each response's
+    X-Ratelimit-Remaining / X-Ratelimit-Reset headers recalibrate the pace: the remaining
+    allowance is spread evenly over what is left of the window, with bursts of up to
+    REDDIT_BURST_FRACTION of it so short jobs are not paced needlessly. Until headers
+    arrive it behaves like a token bucket at REDDIT_REQUESTS_PER_MINUTE.
+    """
+
+    def __init__(self, requests_per_minute=REDDIT_REQUESTS_PER_MINUTE, burst=REDDIT_BURST):
+        self.default_rate = requests_per_minute / 60
+        self.min_burst = burst
+        self.rate = self.default_rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.window_reset = None
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.window_reset is not None and now >= self.window_reset:
+            # A new window started and no response has told us its allowance yet
+            self.window_reset = None
+            self.rate = self.default_rate
+            self.capacity = self.min_burst
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Claim the next request slot and return how many seconds to wait for it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            self.pending += 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def release(self):
+        """Finish a reserved request whose response carried no rate-limit headers."""
+        with self._lock:
+            self.pending = max(0, self.pending - 1)
+
+    def update(self, remaining, reset_seconds):
+        """Finish a reserved request and recalibrate from its rate-limit headers."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.pending = max(0, self.pending - 1)
+            available = remaining - self.pending
+            reset_seconds = max(reset_seconds, 1)
+            self.window_reset = now + reset_seconds
+
+            if available < 1:
+                self.rate = self.default_rate
+                self.capacity = self.min_burst
+                self.tokens = min(self.tokens, -reset_seconds * self.rate)
+            else:
+                self.rate = available / reset_seconds
+                self.capacity = max(self.min_burst, available * REDDIT_BURST_FRACTION)
+                self.tokens = min(self.tokens, available)
+
+    def update_from_headers(self, headers):
+        remaining = headers.get('x-ratelimit-remaining')
+        reset = headers.get('x-ratelimit-reset')
+        if remaining is None or reset is None:
+            self.release()
+        else:
+            self.update(float(remaining), float(reset))
+
+    def pause(self, seconds):
+        """Hold back every caller for at least the given number of seconds (e.g. after a 429)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+rate_limiter = RateLimitScheduler()
+
+class AsyncRedditClient:
+    """aiohttp client for Reddit's JSON API.
+
+    One instance lives on the fetch loop so every Flask request shares its connection pool,
+    its concurrency limit and the rate-limit scheduler. Requests are authenticated with the
+    application-only OAuth flow when client credentials are configured.
+    """
+
+    def __init__(self, client_id, client_secret, base_url=REDDIT_API_BASE, auth_url=REDDIT_AUTH_URL,
+                 concurrency=FETCH_CONCURRENCY, scheduler=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = base_url.rstrip('/')
+        self.auth_url = auth_url
+        self.concurrency = concurrency
+        self.scheduler = scheduler or rate_limiter
+        self._session = None
+        self._semaphore = None
+        self._token_lock = None
+        self._token = None
+        self._token_expires = 0
+
+    def _ensure_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                headers={'User-Agent': REDDIT_USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=REDDIT_REQUEST_TIMEOUT)
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._token_lock = asyncio.Lock()
+        return self._session
+
+    async def _auth_headers(self):
+        if not self.client_id:
+            return {}
+        async with self._token_lock:
+            if self._token is None or time.time() >= self._token_expires:
+                async with self._session.post(
+                    self.auth_url,
+                    auth=aiohttp.BasicAuth(self.client_id, self.client_secret or ''),
+                    data={'grant_type': 'client_credentials'}
+                ) as response:
+                    response.raise_for_status()
+                    payload = await response.json()
+                self._token = payload['access_token']
+                self._token_expires = time.time() + payload.get('expires_in', 3600) - 60
+        return {'Authorization': f"bearer {self._token}"}
+
+    async def get(self, path, **params):
+        session = self._ensure_session()
+        params['raw_json'] = '1'
+
+        for attempt in range(REDDIT_MAX_RETRIES + 1):
+            headers = await self._auth_headers()
+            delay = self.scheduler.reserve()
+            try:
+                await asyncio.sleep(delay)
+                async with self._semaphore:
+                    response = await session.get(f"{self.base_url}{path}", params=params, headers=headers)
+            except BaseException:
+                # Cancelled or failed before any response: hand the slot back
+                self.scheduler.release()
+                raise
+
+            async with response:
+                self.scheduler.update_from_headers(response.headers)
+                if response.status == 429 and attempt < REDDIT_MAX_RETRIES:
+                    retry_after = float(response.headers.get('Retry-After')
+                                        or response.headers.get('x-ratelimit-reset') or 5)
+                    logger.warning(f"Rate limited on {path}, backing off {retry_after:.1f}s")
+                    self.scheduler.pause(retry_after)
+                    continue
+                if response.status == 401 and attempt < REDDIT_MAX_RETRIES:
+                    self._token = None
+                    continue
+                response.raise_for_status()
+                return await response.json()
+
+    async def get_comments(self, submission_id, sort, limit, comment_id=None):
+        """Return the submission data and the top-level comment things of a thread."""
+        path = f"/comments/{submission_id}"
+        if comment_id:
+            path += f"/_/{comment_id}"
+        link_listing, comment_listing = await self.get(path, sort=sort, limit=str(limit))
+        return link_listing['data']['children'][0]['data'], comment_listing['data']['children']
+
+    async def get_info(self, fullnames):
+        """Return the data of the things with the given fullnames that exist, in one request."""
+        payload = await self.get('/api/info', id=','.join(fullnames))
+        return [child['data'] for child in payload['data']['children']]
+
+    async def get_more_children(self, link_fullname, children, sort):
+        payload = await self.get(
+            '/api/morechildren',
+            api_type='json',
+            link_id=link_fullname,
+            children=','.join(children),
+            sort=sort
+        )
+        return payload['json']['data']['things']
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+reddit_client = AsyncRedditClient(os.getenv('REDDIT_CLIENT_ID'), os.getenv('REDDIT_CLIENT_SECRET'))
+
+post_info_cache = ResultCache(POST_INFO_CACHE_MAX_ENTRIES, POST_INFO_TTL)
+
+def cache_post_info(submission):
+    """Remember the metadata of a submission's link data and return it."""
+    info = {
+        'title': submission['title'],
+        'num_comments': submission['num_comments'],
+        'created_utc': submission['created_utc']
+    }
+    post_info_cache.set(submission['id'], info)
+    return info
+
+async def fetch_post_info_async(submission_ids):
+    """Return {submission_id: info} for the given threads, looking up uncached ones in bulk.
+
+    Threads that do not exist are left out.
+    """
+    infos = {}
+    missing = []
+    for submission_id in dict.fromkeys(submission_ids):
+        info = post_info_cache.get(submission_id)
+        if info is None:
+            missing.append(submission_id)
+        else:
+            infos[submission_id] = info
+
+    batches = [missing[i:i + POST_INFO_BATCH_SIZE] for i in range(0, len(missing), POST_INFO_BATCH_SIZE)]
+    results = await asyncio.gather(*(
+        reddit_client.get_info([f"t3_{submission_id}" for submission_id in batch]) for batch in batches
+    ))
+    for submissions in results:
+        for submission in submissions:
+            infos[submission['id']] = cache_post_info(submission)
+    return infos
+
+class CommentTree:
+    """Comment forest built from Reddit's JSON listings, mirroring PRAW's CommentForest.
+
+    'more' stubs are kept in a heap ordered by expected yield instead of in the tree,
+    and comments() walks the loaded comments breadth-first like CommentForest.list().
+    """
+
+    def __init__(self, link_fullname):
+        self.link_fullname = link_fullname
+        self.roots = []
+        self.nodes = {}
+        self.more = []
+        self.top_score = 0
+        self._more_seq = 0
+
+    def add(self, things):
+        for thing in things:
+            kind, data = thing['kind'], thing['data']
+            if kind == 'more':
+                self.push_more(data)
+                continue
+            if kind != 't1' or data['name'] in self.nodes:
+                continue
+
+            node = {'data': data, 'replies': []}
+            self.nodes[data['name']] = node
+            parent = self.nodes.get(data['parent_id'])
+            if parent:
+                parent['replies'].append(node)
+            else:
+                self.roots.append(node)
+                self.top_score = max(self.top_score, data.get('score', 0))
+
+            if data.get('replies'):
+                self.add(data['replies']['data']['children'])
+
+    def expected_yield(self, more):
+        """Comments one request for this stub should load, weighted by how well its parent scored.
+
+        Top-level stubs are weighted like the best top-level comment seen so far.
+        """
+        parent = self.nodes.get(more['parent_id'])
+        parent_score = parent['data'].get('score', 0) if parent else self.top_score
+        comments = max(1, min(more['count'], MORECHILDREN_BATCH_SIZE))
+        return comments * (1 + math.log1p(max(parent_score, 0)))
+
+    def push_more(self, data):
+        heapq.heappush(self.more, (-self.expected_yield(data), self._more_seq, data))
+        self._more_seq += 1
+
+    def pop_more(self):
+        return heapq.heappop(self.more)[2]
+
+    def unexpanded(self):
+        return sum(max(1, more['count']) for _, _, more in self.more)
+
+    def comments(self):
+        queue = deque(self.roots)
+        while queue:
+            node = queue.popleft()
+            yield node['data']
+            queue.extend(node['replies'])
+
+def get_comment_record(comment):
+    return {
+        'id': comment['id'],
+        'text': comment['body'],
+        'score': comment['score'],
+        'created_utc': comment['created_utc']
+    }
+
+def is_deleted(comment):
+    return 'body' not in comment or comment.get('author') in (None, '[deleted]')
+
+def pack_strings(strings):
+    """Concatenate strings into one buffer, returning (buffer, offsets) with len(strings) + 1 offsets."""
+    offsets = array('L', [0])
+    position = 0
+    for string in strings:
+        position += len(string)
+        offsets.append(position)
+    return ''.join(strings), offsets
+
+class CommentRecord:
+    """Read-only view of one comment in a CommentBatch, indexable like a comment record dict."""
+
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def id(self):
+        return self.batch.id_at(self.index)
+
+    @property
+    def text(self):
+        return self.batch.text_at(self.index)
+
+    @property
+    def score(self):
+        return self.batch.scores[self.index]
+
+    @property
+    def created_utc(self):
+        return self.batch.created[self.index]
+
+    def __getitem__(self, key):
+        if key not in ('id', 'text', 'score', 'created_utc'):
+            raise KeyError(key)
+        return getattr(self, key)
+
+class CommentBatch:
+    """Columnar store of comments: texts and ids packed into offset-indexed buffers, scores and
+    creation times in typed arrays.
+
+    Iterating yields CommentRecord views, so code written against comment record dicts keeps
+    working; hot paths use texts() and scores directly.
+    """
+
+    __slots__ = ('text_buffer', 'text_offsets', 'id_buffer', 'id_offsets', 'scores', 'created')
+
+    def __init__(self, texts=(), scores=(), ids=None, created=None):
+        texts = list(texts)
+        self.text_buffer, self.text_offsets = pack_strings(texts)
+        self.id_buffer, self.id_offsets = pack_strings(list(ids) if ids is not None else [''] * len(texts))
+        self.scores = scores if isinstance(scores, array) else array('i', scores)
+        self.created = created if isinstance(created, array) else array('d', created if created is not None else [0.0] * len(texts))
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(
+            [record['text'] for record in records],
+            [record['score'] for record in records],
+            [record.get('id', '') for record in records],
+            [record.get('created_utc', 0.0) for record in records]
+        )
+
+    @classmethod
+    def concat(cls, batches):
+        batches = list(batches)
+        scores, created = array('i'), array('d')
+        for batch in batches:
+            scores.extend(batch.scores)
+            created.extend(batch.created)
+        return cls(
+            [text for batch in batches for text in batch.texts()],
+            scores,
+            [comment_id for batch in batches for comment_id in batch.ids()],
+            created
+        )
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __iter__(self):
+        return (CommentRecord(self, index) for index in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(len(self))[index]
+            return CommentBatch(
+                [self.text_at(i) for i in indices],
+                array('i', (self.scores[i] for i in indices)),
+                [self.id_at(i) for i in indices],
+                array('d', (self.created[i] for i in indices))
+            )
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return CommentRecord(self, index)
+
+    def text_at(self, index):
+        return self.text_buffer[self.text_offsets[index]:self.text_offsets[index + 1]]
+
+    def id_at(self, index):
+        return self.id_buffer[self.id_offsets[index]:self.id_offsets[index + 1]]
+
+    def texts(self):
+        offsets = self.text_offsets
+        return [self.text_buffer[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+
+    def ids(self):
+        offsets = self.id_offsets
+        return [self.id_buffer[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+
+    def with_texts(self, texts):
+        """A batch of the same comments with their texts replaced, e.g. by clean_texts output."""
+        return CommentBatch(texts, self.scores, self.ids(), self.created)
+
+    def to_records(self):
+        return [
+            {'id': comment_id, 'text': text, 'score': score, 'created_utc': created}
+            for comment_id, text, score, created in zip(self.ids(), self.texts(), self.scores, self.created)
+        ]
+
+def comment_texts(comments):
+    """Return the texts of a CommentBatch or a list of comment record dicts."""
+    if isinstance(comments, CommentBatch):
+        return comments.texts()
+    return [comment['text'] for comment in comments]
+
+def comment_columns(comments):
+    """Return (texts, scores) of a CommentBatch or a list of comment record dicts."""
+    if isinstance(comments, CommentBatch):
+        return comments.texts(), comments.scores
+    return [comment['text'] for comment in comments], [comment['score'] for comment in comments]
+
+async def load_more_comments(tree, submission_id, more, sort):
+    """Fetch the things behind one 'more' stub."""
+    try:
+        if more['count'] == 0 or not more['children']:
+            # "Continue this thread" stubs have to be loaded through their parent comment
+            parent_id = more['parent_id'].split('_', 1)[1]
+            _, things = await reddit_client.get_comments(
+                submission_id, sort, COMMENT_PAGE_LIMIT, comment_id=parent_id
+            )
+            replies = things[0]['data'].get('replies') if things else None
+            return replies['data']['children'] if replies else []
+        return await reddit_client.get_more_children(
+            tree.link_fullname, more['children'][:MORECHILDREN_BATCH_SIZE], sort
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+        logger.warning(f"Failed to expand more comments for {submission_id}: {e}")
+        return []
+
+async def expand_more_comments(tree, submission_id, sort, max_requests=None, time_budget=MORE_COMMENTS_TIME_BUDGET):
+    """Expand 'more' stubs concurrently, highest expected yield first, within a request and time budget.
+
+    Stubs revealed by a response are planned along with the rest as soon as it arrives.
+    Returns the number of comments left unexpanded.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + time_budget
+    in_flight = {}
+    requests = 0
+
+    try:
+        while tree.more or in_flight:
+            while (tree.more and len(in_flight) < MORE_COMMENTS_CONCURRENCY
+                   and (max_requests is None or requests < max_requests)):
+                more = tree.pop_more()
+                if len(more['children']) > MORECHILDREN_BATCH_SIZE:
+                    leftover = more['children'][MORECHILDREN_BATCH_SIZE:]
+                    tree.push_more({**more, 'children': leftover, 'count': len(leftover)})
+                task = asyncio.create_task(load_more_comments(tree, submission_id, more, sort))
+                in_flight[task] = more
+                requests += 1
+
+            if not in_flight:
+                break
+
+            done, _ = await asyncio.wait(in_flight, timeout=max(0, deadline - loop.time()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.warning(f"More comments time budget ({time_budget}s) used up for {submission_id}")
+                break
+            for task in done:
+                del in_flight[task]
+                tree.add(task.result())
+    finally:
+        # Also runs when this coroutine is cancelled or a request failed, so no fetch outlives it
+        for task, more in in_flight.items():
+            task.cancel()
+            tree.push_more(more)
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+    unexpanded = tree.unexpanded()
+    logger.info(f"Expanded more comments for {submission_id} with {requests} requests, {unexpanded} left unexpanded")
+    return unexpanded
+
+def merge_comment_delta(snapshot_comments, delta_comments, max_comments):
+    """Merge newly fetched comments into a cached snapshot.
+
+    Comments already in the snapshot only have their score updated; unseen ones are appended.
+    Returns the merged list and the number of new and score-changed comments.
+    """
+    by_id = {comment['id']: comment for comment in snapshot_comments}
+    merged = list(snapshot_comments)
+    new_count = 0
+    changed_count = 0
+
+    for comment in delta_comments:
+        existing = by_id.get(comment['id'])
+        if existing is None:
+            if len(merged) < max_comments:
+                merged.append(comment)
+                by_id[comment['id']] = comment
+                new_count += 1
+        elif existing['score'] != comment['score']:
+            existing['score'] = comment['score']
+            changed_count += 1
+
+    return merged, new_count, changed_count
+
+def refresh_comments_incrementally(tree, snapshot, max_comments):
+    """Update a stale snapshot from a tree of the thread's newest comments.
+
+    Returns the merged comments and how many new comments the tree showed, filtered ones included.
+    Replies hidden behind the tree's 'more' stubs are not loaded, so callers should only count
+    the comments seen here as covered by the snapshot.
+    """
+    high_water = max((comment['created_utc'] for comment in snapshot['comments']), default=0)
+    snapshot_ids = {comment['id'] for comment in snapshot['comments']}
+
+    delta = []
+    seen_count = 0
+    for comment in tree.comments():
+        is_new = comment['created_utc'] > high_water and comment['id'] not in snapshot_ids
+        seen_count += is_new
+        if is_deleted(comment) or comment['author'] == 'AutoModerator' or comment['score'] < 1:
+            continue
+        if is_new or comment['id'] in snapshot_ids:
+            delta.append(get_comment_record(comment))
+
+    comments, new_count, changed_count = merge_comment_delta(snapshot['comments'], delta, max_comments)
+    logger.info(f"Incremental refresh of {snapshot['submission_id']}: {new_count} new, {changed_count} rescored")
+    return comments, seen_count
+
+async def fetch_reddit_data_async(url, max_comments=10000, timeout=300):
+    """Get Reddit data using official API within free tier limits
+
+    The returned version is the stored_at of the comment cache snapshot that was served or stored.
+    """
     try:
         submission_id = get_submission_id(url)
         if not submission_id:
             logger.warning(f"Invalid URL: {url}")
             return None
 
-        try:
-            submission = reddit.submission(id=submission_id)
-            submission.comment_sort = 'top'
-        except Exception as e:
-            if "Too Many Requests" in str(e):
-                logger.warning("Rate limit hit, waiting 5 seconds...")
-                time.sleep(5)
-                submission = reddit.submission(id=submission_id)
-                submission.comment_sort = 'top'
-            else:
-                raise
-
-        total_comments = submission.num_comments
+        start_time = time.time()
+        submission = None
+        snapshot = await asyncio.to_thread(comment_cache.get, submission_id) if comment_cache else None
+
+        if snapshot:
+            num_comments = None
+            if comment_cache.is_expired(snapshot):
+                # A recent post info lookup, e.g. from adding the thread in the UI, may already show
+                # the thread unchanged
+                info = post_info_cache.get(submission_id)
+                if info and comment_cache.is_unchanged(snapshot['num_comments'], info['num_comments']):
+                    num_comments = info['num_comments']
+                else:
+                    # Revalidation loads the newest comments so a small delta needs no second request
+                    sort = 'new' if INCREMENTAL_REFRESH else 'top'
+                    submission, things = await reddit_client.get_comments(submission_id, sort,
+                                                                          INCREMENTAL_COMMENT_LIMIT)
+                    num_comments = cache_post_info(submission)['num_comments']
+
+            if await asyncio.to_thread(comment_cache.is_fresh, snapshot, num_comments):
+                logger.info(f"Serving {len(snapshot['comments'])} cached comments for {url}")
+                return {'comments': CommentBatch.from_records(snapshot['comments']), 'version': snapshot['stored_at']}
+
+            if INCREMENTAL_REFRESH and num_comments - snapshot['num_comments'] <= INCREMENTAL_MAX_DELTA:
+                tree = CommentTree(submission['name'])
+                tree.add(things)
+                comments, seen_count = refresh_comments_incrementally(tree, snapshot, max_comments)
+                # Store the count the snapshot covers, not the live one, and fetch the thread in full
+                # when too many new comments were hidden behind 'more' stubs of the newest listing
+                covered_comments = min(num_comments, snapshot['num_comments'] + seen_count)
+                if comment_cache.is_unchanged(covered_comments, num_comments):
+                    version = await asyncio.to_thread(comment_cache.store, submission_id, comments,
+                                                      covered_comments, submission['created_utc'], True)
+                    return {'comments': CommentBatch.from_records(comments), 'version': version}
+                logger.info(f"Incremental refresh of {submission_id} missed "
+                            f"{num_comments - covered_comments} comments, refetching")
+
+            if INCREMENTAL_REFRESH:
+                submission = None
+
+        if submission is None:
+            submission, things = await reddit_client.get_comments(submission_id, 'top', COMMENT_PAGE_LIMIT)
+            cache_post_info(submission)
+
+        tree = CommentTree(submission['name'])
+        tree.add(things)
+
+        total_comments = submission['num_comments']
 
         if total_comments <= 500:
-            submission.comments.replace_more(limit=None)
+            unexpanded = await expand_more_comments(tree, submission_id, 'top')
         else:
-            replace_limit = min(16, max(8, total_comments // 500))
-            submission.comments.replace_more(limit=replace_limit)
+            max_requests = min(MORE_COMMENTS_MAX_REQUESTS, max(16, total_comments // 200))
+            unexpanded = await expand_more_comments(tree, submission_id, 'top', max_requests=max_requests)
 
         comments = []
-        comment_count = 0
-        start_time = time.time()
-        
-        comment_batch = []
-        BATCH_SIZE = 100
+        walk_start = time.time()
 
         low_score_streak = 0
         MAX_LOW_SCORE_STREAK = 5
         MIN_ACCEPTABLE_SCORE = 1
         
-        for comment in submission.comments.list():
-            if time.time() - start_time > timeout:
-                logger.warning(f"Timeout reached for {url} after {comment_count} comments")
+        for comment in tree.comments():
+            if time.time() - walk_start > timeout:
+                logger.warning(f"Timeout reached for {url} after {len(comments)} comments")
                 break
                 
-            if comment_count >= max_comments:
+            if len(comments) >= max_comments:
                 logger.warning(f"Max comments ({max_comments}) reached for {url}")
                 break
 
-            if not hasattr(comment, 'score') or not hasattr(comment, 'body') or not comment.author:
+            if is_deleted(comment):
                 continue
                 
-            comment_score = comment.score
+            comment_score = comment['score']
 
             if comment_score < MIN_ACCEPTABLE_SCORE:
                 low_score_streak += 1
                 if low_score_streak >= MAX_LOW_SCORE_STREAK:
-                    logger.info(f"Breaking early after {comment_count} comments due to {MAX_LOW_SCORE_STREAK} consecutive low-scoring comments")
+                    logger.info(f"Breaking early after {len(comments)} comments due to {MAX_LOW_SCORE_STREAK} consecutive low-scoring comments")
                     break
                 continue
             else:
                 low_score_streak = 0
                 
-            if (comment.author.name != 'AutoModerator' and comment_score >= 0):
-                comment_batch.append({
-                    'text': comment.body,
-                    'score': comment_score
-                })
-                comment_count += 1
-                
-                if len(comment_batch) >= BATCH_SIZE:
-                    comments.extend(comment_batch)
-                    comment_batch = []
-                    
-                    time.sleep(0.1)
-        
-        if comment_batch:
-            comments.extend(comment_batch)
+            if comment['author'] != 'AutoModerator' and comment_score >= 0:
+                comments.append(get_comment_record(comment))
                 
         if comments:
             logger.info(f"Successfully fetched {len(comments)} comments from {url} in {time.time() - start_time:.2f}s")
-            return {'comments': comments}
+            version = None
+            if comment_cache:
+                version = await asyncio.to_thread(comment_cache.store, submission_id, comments, total_comments,
+                                                  submission['created_utc'])
+            return {'comments': CommentBatch.from_records(comments), 'unexpanded': unexpanded, 'version': version}
         else:
             logger.warning(f"No comments fetched from {url}")
             return None
@@ -220,18 +1321,181 @@ def get_reddit_data(url, max_comments=10000, timeout=300):
         logger.error(f"Error fetching Reddit data: {str(e)}")
         return None
 
-@lru_cache(maxsize=1000)
-def tokenize_and_filter(text: str) -> Tuple[str, ...]:
-    """Cache tokenization results for identical text."""
+def get_fetch_loop():
+    """Return the event loop all Reddit fetches run on, starting it on first use."""
+    global _fetch_loop
+    with _fetch_loop_lock:
+        if _fetch_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='reddit-fetch', daemon=True).start()
+            atexit.register(lambda: asyncio.run_coroutine_threadsafe(reddit_client.close(), loop).result(5))
+            _fetch_loop = loop
+    return _fetch_loop
+
+def get_post_info_batch(submission_ids):
+    """Blocking wrapper around fetch_post_info_async."""
+    return asyncio.run_coroutine_threadsafe(fetch_post_info_async(submission_ids), get_fetch_loop()).result()
+
+def get_reddit_data(url, max_comments=10000, timeout=300):
+    """Blocking wrapper around fetch_reddit_data_async for a single thread."""
+    return asyncio.run_coroutine_threadsafe(
+        fetch_reddit_data_async(url, max_comments, timeout), get_fetch_loop()
+    ).result()
+
+def iter_reddit_data(urls, deadline=None, fetch_times=None):
+    """Fetch threads concurrently on the fetch loop, yielding (url, data) as each one completes.
+
+    Stops early once deadline (a time.time() value) passes; unfinished fetches are cancelled.
+    If given, fetch_times is filled with the seconds each finished fetch took.
+    """
+    results = queue.Queue()
+
+    async def fetch(url):
+        start = time.time()
+        try:
+            data = await fetch_reddit_data_async(url)
+            if fetch_times is not None:
+                fetch_times[url] = time.time() - start
+            results.put((url, data))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Error processing {url}: {str(e)}")
+            results.put((url, None))
+
+    loop = get_fetch_loop()
+    futures = [asyncio.run_coroutine_threadsafe(fetch(url), loop) for url in urls]
+    try:
+        for _ in urls:
+            remaining = None if deadline is None else deadline - time.time()
+            try:
+                yield results.get(timeout=max(0, remaining) if remaining is not None else None)
+            except queue.Empty:
+                logger.warning("Approaching Vercel timeout limit, processing with current comments")
+                return
+    finally:
+        for future in futures:
+            future.cancel()
+
+def get_extract_pool():
+    """Return the process pool used for sharded extraction, or None if sharding is disabled."""
+    global _extract_pool
+    if EXTRACT_WORKERS < 2:
+        return None
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            # spawn rather than fork: the parent has the fetch loop and Flask threads running
+            _extract_pool = ProcessPoolExecutor(EXTRACT_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_extract_pool.shutdown, cancel_futures=True)
+    return _extract_pool
+
+def split_shards(items, num_shards):
+    """Split items into at most num_shards contiguous slices, returning (offset, slice) pairs."""
+    size = math.ceil(len(items) / num_shards)
+    return [(start, items[start:start + size]) for start in range(0, len(items), size)]
+
+def split_tokenize(text: str) -> List[str]:
+    """word_tokenize for clean_text output: a whitespace split plus NLTK's contraction splits."""
+    tokens = []
+    for token in text.split():
+        split_at = CONTRACTION_SPLITS.get(token.lower())
+        if split_at:
+            tokens.append(token[:split_at])
+            tokens.append(token[split_at:])
+        else:
+            tokens.append(token)
+    return tokens
+
+def tokenize(text: str) -> Tuple[str, ...]:
+    """Tokenize text with the configured backend."""
+    if TOKENIZER_BACKEND == 'fast' and CLEANED_TEXT_REGEX.fullmatch(text):
+        return tuple(split_tokenize(text))
     tokens = word_tokenize(text)
     return tuple(token for token in tokens)
 
+class TokenCache:
+    """LRU cache of tokenized texts keyed by a BLAKE2b digest of the text, bounded in bytes.
+
+    Only the 16-byte digest is kept per entry, not the text itself. Entry sizes count the token
+    tuple and its strings.
+    """
+
+    def __init__(self, max_bytes=TOKEN_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def entry_size(tokens):
+        return sys.getsizeof(tokens) + sum(sys.getsizeof(token) for token in tokens)
+
+    def tokenize(self, text):
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        tokens = tokenize(text)
+        size = self.entry_size(tokens)
+        if size > self.max_bytes:
+            return tokens
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (tokens, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.size -= evicted_size
+                    self.evictions += 1
+        return tokens
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size
+            }
+
+token_cache = TokenCache()
+
+def tokenize_and_filter(text: str) -> Tuple[str, ...]:
+    """Cache tokenization results for identical text."""
+    return token_cache.tokenize(text)
+
 def clean_text(text):
     """Clean text by removing URLs, non-letters/non-numbers, and extra spaces."""
     text = URL_REGEX.sub('', text)
     text = CLEAN_TEXT_REGEX.sub('', text)
     return MULTISPACE_REGEX.sub(' ', text).strip()
 
+def clean_texts(texts):
+    """clean_text for a batch of texts, done in a few passes over the texts joined together."""
+    if not texts:
+        return []
+    joined = TEXT_SEPARATOR.join(texts)
+    if joined.count(TEXT_SEPARATOR) != len(texts) - 1:
+        return [clean_text(text) for text in texts]
+    if 'http' in joined:
+        joined = URL_REGEX.sub('', joined)
+    if joined.isascii():
+        joined = SPACE_RUN_REGEX.sub(' ', joined.translate(ASCII_CLEAN_TABLE))
+    else:
+        joined = MULTISPACE_BATCH_REGEX.sub(' ', CLEAN_BATCH_REGEX.sub('', joined))
+    joined = joined.replace(' ' + TEXT_SEPARATOR, TEXT_SEPARATOR).replace(TEXT_SEPARATOR + ' ', TEXT_SEPARATOR)
+    return joined.strip(' ').split(TEXT_SEPARATOR)
+
 def preprocess_ngram(ngram: Tuple[str, ...], remove_lowercase: bool = True, custom_words: set = None) -> bool:
     """Preprocess and validate an n-gram tuple.
     
@@ -274,7 +1538,7 @@ def preprocess_ngram(ngram: Tuple[str, ...], remove_lowercase: bool = True, cust
         is_special_ending = (
             (last_word == 'I' and len(ngram) > 1 and 
              ngram[-2] in SPECIAL_PREFIXES) or
-            (last_word.lower() in {word.lower() for word in SPECIAL_PREFIXES} and len(ngram) > 1)
+            (last_word.lower() in SPECIAL_PREFIXES_LOWER and len(ngram) > 1)
         )
         return (first_word[0].isupper() and 
                 (has_number_end or is_special_ending or (last_word[0].isupper() and last_word != 'I')))
@@ -289,11 +1553,6 @@ def normalize_phrase(phrase: str) -> str:
     if not words:
         return phrase
         
-    roman_to_num = {'I': '1', 'II': '2', 'III': '3', 'IV': '4', 'V': '5', 
-                    'VI': '6', 'VII': '7', 'VIII': '8', 'IX': '9', 'X': '10'}
-    num_to_roman = {v: k for k, v in roman_to_num.items()}
-    
-    ordinal_pattern = re.compile(r'(\d+)(st|nd|rd|th)')
     last_word = words[-1]
     
     if last_word in SPECIAL_PREFIXES:
@@ -302,12 +1561,13 @@ def normalize_phrase(phrase: str) -> str:
             return phrase
         last_word = words[-1]
     
-    if last_word in roman_to_num:
-        words[-1] = roman_to_num[last_word]
-    elif last_word in num_to_roman:
-        words[-1] = num_to_roman[last_word]
-    elif ordinal_pattern.match(last_word):
-        words[-1] = ordinal_pattern.match(last_word).group(1)
+    ordinal = ORDINAL_REGEX.match(last_word)
+    if last_word in ROMAN_TO_NUM:
+        words[-1] = ROMAN_TO_NUM[last_word]
+    elif last_word in NUM_TO_ROMAN:
+        words[-1] = NUM_TO_ROMAN[last_word]
+    elif ordinal:
+        words[-1] = ordinal.group(1)
     
     if len(words) >= 3:
         acronym = ''.join(word[0].upper() for word in words if word[0].isalpha())
@@ -316,46 +1576,627 @@ def normalize_phrase(phrase: str) -> str:
             
     return ' '.join(words)
 
-def extract_filtered_phrases(comments, min_ngram=1, max_ngram=5, top_n=10, apply_remove_lowercase=True, custom_words=None):
-    """Extract all relevant phrases and then select the top_n phrases after filtering."""
-    
-    ngram_counts = Counter()
-    normalized_to_original = {}
-    
-    for comment in comments:
-        tokens = tokenize_and_filter(comment['text'])
-        for n in range(min_ngram, max_ngram + 1):
-            for ngram in nltk.ngrams(tokens, n):
-                if preprocess_ngram(ngram, apply_remove_lowercase, custom_words):
-                    phrase = ' '.join(ngram) if len(ngram) > 1 else ngram[0]
-                    normalized = normalize_phrase(phrase)
-                    ngram_counts[normalized] += 1
-                    
-                    if normalized not in normalized_to_original or phrase.istitle():
-                        normalized_to_original[normalized] = phrase
+class PhraseCounter:
+    """Counts filtered, normalized n-grams of cleaned comments one batch at a time.
+
+    Lets the handler count each thread as soon as it is fetched instead of waiting for all of them.
+    Tokens are interned to ints and every n-gram length is counted in one walk over each comment,
+    keyed by int tuples; phrase strings are only built and normalized once per unique n-gram.
+
+    With a capacity, counts are kept as a Misra-Gries summary of at most that many n-grams (see
+    prune), so memory stays bounded however many comments are added. Counts may then fall short
+    of the true ones by up to count_error, and any n-gram seen more than count_error times is kept.
+    """
+
+    def __init__(self, min_ngram=1, max_ngram=5, apply_remove_lowercase=True, custom_words=None, token_cache=None,
+                 capacity=None):
+        self.min_ngram = min_ngram
+        self.max_ngram = max_ngram
+        self.apply_remove_lowercase = apply_remove_lowercase
+        self.custom_words = custom_words
+        self.token_cache = token_cache
+        self.capacity = capacity
+        self.count_error = 0
+        self.tokens = []
+        self.token_ids = {}
+        self.token_flags = []
+        self.token_initials = []
+        self.token_last_forms = []
+        self.stats = {}
+        self.num_comments = 0
+        self._phrases = None
+
+    def intern(self, token):
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = self.token_ids[token] = len(self.tokens)
+            self.tokens.append(token)
+            self.token_flags.append(self.token_flags_for(token))
+            last_form = self.last_word_form(token)
+            self.token_initials.append(token[0].upper() if token[0].isalpha() else '')
+            self.token_last_forms.append((last_form, last_form[0].upper() if last_form[0].isalpha() else ''))
+        return token_id
+
+    @staticmethod
+    def last_word_form(token):
+        """How normalize_phrase rewrites token when it ends a phrase."""
+        if token in ROMAN_TO_NUM:
+            return ROMAN_TO_NUM[token]
+        if token in NUM_TO_ROMAN:
+            return NUM_TO_ROMAN[token]
+        ordinal = ORDINAL_REGEX.match(token)
+        return ordinal.group(1) if ordinal else token
+
+    def normalize(self, key, phrase):
+        """normalize_phrase(phrase) for the interned tokens in key, from the per-token tables."""
+        if self.token_flags[key[-1]] & TOKEN_SPECIAL_PREFIX:
+            key = key[:-1]
+            if not key:
+                return phrase
+        last_form, last_initial = self.token_last_forms[key[-1]]
+        words = ' '.join([self.tokens[token_id] for token_id in key[:-1]] + [last_form])
+        if len(key) >= 3:
+            acronym = ''.join([self.token_initials[token_id] for token_id in key[:-1]]) + last_initial
+            if len(acronym) >= 3:
+                return f"{words}|{acronym}"
+        return words
+
+    def token_flags_for(self, token):
+        """Classify a token once into TOKEN_* bits."""
+        token_lower = token.lower()
+        flags = 0
+        if self.custom_words and token_lower in self.custom_words:
+            flags |= TOKEN_CUSTOM
+        if len(token) <= 1:
+            flags |= TOKEN_SHORT
+        if token in COMMON_STARTERS:
+            flags |= TOKEN_STARTER
+        if NUMERIC_START_REGEX.match(token):
+            flags |= TOKEN_NUMERIC
+        if token_lower in custom_stop_words:
+            flags |= TOKEN_STOPWORD
+        if token[:1].isupper():
+            flags |= TOKEN_CAPITALIZED
+        if token == 'I':
+            flags |= TOKEN_I
+        if token in SPECIAL_PREFIXES:
+            flags |= TOKEN_SPECIAL_PREFIX
+        if token_lower in SPECIAL_PREFIXES_LOWER:
+            flags |= TOKEN_SPECIAL_PREFIX_LOWER
+        if CONNECTING_WORDS_REGEX.search(token):
+            flags |= TOKEN_CONNECTING
+        return flags
+
+    def is_valid(self, key):
+        """preprocess_ngram on interned tokens, as bitmask checks on their flags."""
+        flags = self.token_flags
+        first = flags[key[0]]
+        if first & TOKEN_CUSTOM:
+            return False
+        if len(key) == 1:
+            if first & (TOKEN_SHORT | TOKEN_STARTER):
+                return False
+            return not self.apply_remove_lowercase or bool(first & TOKEN_CAPITALIZED)
+
+        if self.custom_words and any(flags[token_id] & TOKEN_CUSTOM for token_id in key):
+            return False
+        if first & (TOKEN_STARTER | TOKEN_NUMERIC):
+            return False
+        if all(flags[token_id] & TOKEN_STOPWORD for token_id in key):
+            return False
+
+        last = flags[key[-1]]
+        if self.apply_remove_lowercase:
+            is_special_ending = (
+                (last & TOKEN_I and flags[key[-2]] & TOKEN_SPECIAL_PREFIX) or
+                last & TOKEN_SPECIAL_PREFIX_LOWER
+            )
+            return bool(first & TOKEN_CAPITALIZED and
+                        (last & TOKEN_NUMERIC or is_special_ending or
+                         (last & TOKEN_CAPITALIZED and not last & TOKEN_I)))
+
+        return not last & TOKEN_CONNECTING
+
+    def add(self, comments):
+        pool = get_extract_pool() if len(comments) >= SHARD_MIN_COMMENTS else None
+        if pool is not None:
+            try:
+                self.add_sharded(comments, pool)
+                return
+            except Exception as e:
+                logger.warning(f"Sharded phrase counting failed, counting in-process: {str(e)}")
+        self.count(comments)
+
+    def add_sharded(self, comments, pool):
+        """Count comments in contiguous shards on pool and merge the partial counts in shard order."""
+        shards = split_shards(comment_texts(comments), EXTRACT_WORKERS)
+        futures = [
+            pool.submit(count_phrase_shard, texts, self.num_comments + offset, self.min_ngram,
+                        self.max_ngram, self.apply_remove_lowercase, self.custom_words, self.capacity)
+            for offset, texts in shards
+        ]
+        partials = [future.result() for future in futures]
+        for tokens, stats, count_error in partials:
+            self.merge(tokens, stats, count_error)
+        self.num_comments += len(comments)
+
+    def merge(self, tokens, stats, count_error=0):
+        """Merge the valid stats of another counter whose token ids index into tokens.
+
+        Summaries add up: the merged counts are short by at most the sum of both count errors.
+        """
+        self._phrases = None
+        self.count_error += count_error
+        for key, (count, first, last) in stats.items():
+            key = tuple(self.intern(tokens[token_id]) for token_id in key)
+            entry = self.stats.get(key)
+            if entry is None:
+                self.stats[key] = [count, first, last]
+            elif entry:
+                entry[0] += count
+                entry[1] = min(entry[1], first)
+                entry[2] = max(entry[2], last)
+        if self.capacity and len(self.stats) > self.capacity:
+            self.prune()
+
+    def merge_counts(self, tokens, stats, offset):
+        """Merge n-gram counts cached by ThreadCountCache as if counted from comment offset on.
+
+        The cached counts cover every length up to NGRAM_CACHE_MAX_N and ignore custom words, which
+        only ever reject n-grams, so both filters are applied here.
+        """
+        self._phrases = None
+        base = offset << 40
+        flags = self.token_flags
+        token_ids = {}
+        for key, (count, first, last) in stats.items():
+            if not self.min_ngram <= len(key) <= self.max_ngram:
+                continue
+            ids = []
+            for token_id in key:
+                own_id = token_ids.get(token_id)
+                if own_id is None:
+                    own_id = token_ids[token_id] = self.intern(tokens[token_id])
+                ids.append(own_id)
+            key = tuple(ids)
+            if self.custom_words and any(flags[token_id] & TOKEN_CUSTOM for token_id in key):
+                continue
+            entry = self.stats.get(key)
+            if entry is None:
+                self.stats[key] = [count, first + base, last + base]
+            elif entry:
+                entry[0] += count
+                entry[1] = min(entry[1], first + base)
+                entry[2] = max(entry[2], last + base)
+
+    def count(self, comments):
+        self.count_texts(comment_texts(comments))
+
+    def count_texts(self, texts):
+        """Count cleaned texts as the next comments."""
+        min_ngram, max_ngram = self.min_ngram, self.max_ngram
+        flags = self.token_flags
+        stats = self.stats
+        self._phrases = None
+        max_entries = 2 * self.capacity if self.capacity else None
+
+        # Cheap necessary conditions on the first and last token; is_valid has the final say
+        start_reject = TOKEN_STARTER | TOKEN_NUMERIC
+        unigram_reject = TOKEN_SHORT | TOKEN_STARTER
+        required = TOKEN_CAPITALIZED if self.apply_remove_lowercase else 0
+        if self.apply_remove_lowercase:
+            end_mask = TOKEN_NUMERIC | TOKEN_I | TOKEN_CAPITALIZED | TOKEN_SPECIAL_PREFIX_LOWER
+            end_test = lambda last: last & end_mask
+        else:
+            end_test = lambda last: not last & TOKEN_CONNECTING
+
+        for text in texts:
+            tokens = self.token_cache.tokenize(text) if self.token_cache else tokenize_and_filter(text)
+            ids = [self.intern(token) for token in tokens]
+            base = self.num_comments << 40
+            self.num_comments += 1
+            if max_entries and len(stats) > max_entries:
+                self.prune()
+
+            for i, first_id in enumerate(ids):
+                first = flags[first_id]
+                if first & TOKEN_CUSTOM:
+                    continue
+                if first & required != required:
+                    continue
+                if min_ngram <= 1 and not first & unigram_reject:
+                    self._count((first_id,), base | (1 << 20) | i)
+                if first & start_reject:
+                    continue
+                for j in range(i + 1, min(i + max_ngram, len(ids))):
+                    last = flags[ids[j]]
+                    if last & TOKEN_CUSTOM:
+                        break
+                    n = j - i + 1
+                    if n >= min_ngram and end_test(last):
+                        key = tuple(ids[i:j + 1])
+                        entry = stats.get(key)
+                        if entry:
+                            entry[0] += 1
+                            entry[2] = base | (n << 20) | i
+                        elif entry is None:
+                            self._count(key, base | (n << 20) | i)
+
+    def prune(self):
+        """Shrink stats to at most capacity counted n-grams.
+
+        Cached rejections are dropped. If more than capacity counts remain, the (capacity + 1)-th
+        largest is subtracted from all of them and those left at zero are dropped (Misra-Gries).
+        That count is added to count_error; since each prune removes it from capacity + 1 counts,
+        count_error never exceeds the number of n-grams counted / (capacity + 1).
+        """
+        counts = sorted(entry[0] for entry in self.stats.values() if entry)
+        threshold = counts[-self.capacity - 1] if len(counts) > self.capacity else 0
+        kept = {key: entry for key, entry in self.stats.items() if entry and entry[0] > threshold}
+        for entry in kept.values():
+            entry[0] -= threshold
+        self.count_error += threshold
+        self.stats.clear()
+        self.stats.update(kept)
+
+    def _count(self, key, position):
+        entry = self.stats.get(key)
+        if entry is None:
+            self.stats[key] = [1, position, position] if self.is_valid(key) else False
+        elif entry:
+            entry[0] += 1
+            entry[2] = position
+
+    def phrases(self):
+        """Return (ngram_counts, normalized_to_original) as counting every n-gram in order would.
+
+        Normalized phrases keep first-occurrence order, and the original form is the last title-case
+        variant seen, or else the first variant seen.
+        """
+        if self._phrases is not None:
+            return self._phrases
+
+        groups = {}
+        for key, entry in self.stats.items():
+            if not entry:
+                continue
+            phrase = ' '.join([self.tokens[token_id] for token_id in key])
+            normalized = self.normalize(key, phrase)
+            count, first, last = entry
+            group = groups.get(normalized)
+            if group is None:
+                groups[normalized] = group = [0, first, phrase, None, -1]
+            group[0] += count
+            if first < group[1]:
+                group[1], group[2] = first, phrase
+            if last > group[4] and phrase.istitle():
+                group[3], group[4] = phrase, last
+
+        ngram_counts = Counter()
+        normalized_to_original = {}
+        for normalized, (count, _, first_phrase, title_phrase, _) in sorted(groups.items(), key=lambda item: item[1][1]):
+            ngram_counts[normalized] = count
+            normalized_to_original[normalized] = title_phrase or first_phrase
+
+        self._phrases = ngram_counts, normalized_to_original
+        return self._phrases
+
+class ThreadCountCache:
+    """LRU cache of the n-gram counts of each thread, shared by requests with different parameters.
+
+    A thread is counted once per apply_remove_lowercase setting, for every length up to
+    NGRAM_CACHE_MAX_N and without custom words; requests apply their own bounds and custom words
+    when merging (PhraseCounter.merge_counts). Entries keep a digest of the comments they cover, so
+    a snapshot that only gained comments at the end, as incremental refreshes leave it, just has the
+    new comments counted into another segment.
+    """
+
+    def __init__(self, max_ngrams=NGRAM_CACHE_MAX_NGRAMS):
+        self.max_ngrams = max_ngrams
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.extended = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_size(segments):
+        return sum(len(stats) for _, _, stats in segments)
+
+    def count_segment(self, counter, comments, offset):
+        """Count comments as comments offset, offset + 1, ... of a thread; returns (offset, tokens, stats)."""
+        segment_counter = PhraseCounter(1, NGRAM_CACHE_MAX_N, counter.apply_remove_lowercase,
+                                        token_cache=counter.token_cache)
+        segment_counter.num_comments = offset
+        segment_counter.add(comments)
+        return offset, segment_counter.tokens, {key: entry for key, entry in segment_counter.stats.items() if entry}
+
+    def add_to(self, counter, submission_id, comments):
+        """counter.add(comments) for the complete comments of a thread, from cached counts where possible."""
+        if not submission_id or counter.capacity or counter.max_ngram > NGRAM_CACHE_MAX_N:
+            counter.add(comments)
+            return
+
+        key = (submission_id, counter.apply_remove_lowercase)
+        with self._lock:
+            entry = self.entries.get(key)
+        hasher = hashlib.blake2b(digest_size=16)
+        prefix_digest = None
+        for index, (comment_id, text) in enumerate(zip(comments.ids(), comments.texts())):
+            if entry and index == entry[1]:
+                prefix_digest = hasher.digest()
+            hasher.update(f'{comment_id}\x00{text}\x00'.encode('utf-8'))
+        digest = hasher.digest()
+
+        if entry and entry[0] == digest:
+            segments = entry[2]
+            counter_name = 'hits'
+        elif entry and entry[0] == prefix_digest and len(entry[2]) < NGRAM_CACHE_MAX_SEGMENTS:
+            segments = entry[2] + (self.count_segment(counter, comments[entry[1]:], entry[1]),)
+            counter_name = 'extended'
+        else:
+            segments = (self.count_segment(counter, comments, 0),)
+            counter_name = 'misses'
+
+        for _, tokens, stats in segments:
+            counter.merge_counts(tokens, stats, counter.num_comments)
+        counter.num_comments += len(comments)
+
+        with self._lock:
+            setattr(self, counter_name, getattr(self, counter_name) + 1)
+            if counter_name != 'hits':
+                old = self.entries.pop(key, None)
+                if old is not None:
+                    self.size -= self.entry_size(old[2])
+                # A thread with more n-grams than the whole cache may hold is not kept at all
+                size = self.entry_size(segments)
+                if size <= self.max_ngrams:
+                    self.entries[key] = (digest, len(comments), segments)
+                    self.size += size
+                while self.size > self.max_ngrams:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.size -= self.entry_size(evicted[2])
+            elif key in self.entries:
+                self.entries.move_to_end(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threads': len(self.entries),
+                'ngrams': self.size,
+                'hits': self.hits,
+                'extended': self.extended,
+                'misses': self.misses
+            }
+
+thread_count_cache = ThreadCountCache() if NGRAM_CACHE_ENABLED else None
+
+def count_phrase_shard(texts, offset, min_ngram, max_ngram, apply_remove_lowercase, custom_words, capacity=None):
+    """Worker side of PhraseCounter.add_sharded: count texts as comments offset, offset + 1, ..."""
+    shard_token_cache = TokenCache() if TOKEN_CACHE_SCOPE == 'request' else None
+    counter = PhraseCounter(min_ngram, max_ngram, apply_remove_lowercase, custom_words, token_cache=shard_token_cache,
+                            capacity=capacity)
+    counter.num_comments = offset
+    counter.count_texts(texts)
+    return counter.tokens, {key: entry for key, entry in counter.stats.items() if entry}, counter.count_error
+
+class PhraseVocab:
+    """Per-request table of candidate phrases addressed by integer ids.
+
+    Each phrase's lowercase form, word count, normalized key and acronym are computed once when it
+    is added, so selection, scoring and ranking pass ids around and only turn them back into
+    strings for the response. Lowercase forms and keys share one intern table, so comparing them
+    is an int comparison.
+    """
+
+    def __init__(self, ngram_counts=None):
+        self.ngram_counts = ngram_counts if ngram_counts is not None else Counter()
+        self.ids = {}
+        self.form_ids = {}
+        self.originals = []
+        self.lowers = []
+        self.lower_forms = []
+        self.lengths = []
+        self.keys = []
+        self.key_forms = []
+        self.key_lengths = []
+        self.counts = []
+        self.rank_counts = []
+        self.acronyms = []
+        self.incomplete = []
+
+    @classmethod
+    def from_counter(cls, counter):
+        """Vocabulary of the phrases a PhraseCounter saw at least twice, in first-occurrence order."""
+        ngram_counts, normalized_to_original = counter.phrases()
+        vocab = cls(ngram_counts)
+        for normalized, count in ngram_counts.items():
+            if count >= 2:
+                vocab.add(normalized_to_original[normalized], normalized, count)
+        return vocab
+
+    @classmethod
+    def from_phrases(cls, phrases):
+        """Return (vocab, ids) for a plain list of phrases."""
+        vocab = cls()
+        return vocab, [vocab.add(phrase) for phrase in phrases]
+
+    def __len__(self):
+        return len(self.originals)
+
+    def intern_form(self, form):
+        form_id = self.form_ids.get(form)
+        if form_id is None:
+            form_id = self.form_ids[form] = len(self.form_ids)
+        return form_id
+
+    def add(self, phrase, normalized=None, count=0):
+        """Return the id of phrase, adding it under the normalized key if it is new."""
+        phrase_id = self.ids.get(phrase)
+        if phrase_id is not None:
+            return phrase_id
+        phrase_id = self.ids[phrase] = len(self.originals)
+        phrase_lower = phrase.lower()
+        normalized = phrase if normalized is None else normalized
+        self.originals.append(phrase)
+        self.lowers.append(phrase_lower)
+        self.lower_forms.append(self.intern_form(phrase_lower))
+        self.lengths.append(len(phrase_lower.split()))
+        self.keys.append(normalized)
+        self.key_forms.append(self.intern_form(normalized))
+        self.key_lengths.append(len(normalized.split()))
+        self.counts.append(count)
+        # Selection has always ranked phrases by the count stored under their lowercase form
+        self.rank_counts.append(self.ngram_counts[phrase_lower])
+        self.acronyms.append(normalized.partition('|')[2])
+        self.incomplete.append(is_incomplete_phrase(phrase))
+        return phrase_id
+
+    def phrases(self, phrase_ids):
+        return [self.originals[phrase_id] for phrase_id in phrase_ids]
+
+def extract_filtered_phrases(comments, min_ngram=1, max_ngram=5, top_n=10, apply_remove_lowercase=True, custom_words=None,
+                             capacity=None):
+    """Extract all relevant phrases and then select the top_n phrases after filtering.
+
+    A capacity counts n-grams approximately in bounded memory, as PhraseCounter describes.
+    """
+    counter = PhraseCounter(min_ngram, max_ngram, apply_remove_lowercase, custom_words, capacity=capacity)
+    counter.add(comments)
+    return select_common_phrases(counter, comments, top_n)
+
+class ContainmentIndex:
+    """Multiset of lowercase phrases answering whether a query is a substring of any of them.
+
+    Queries without spaces can only fall inside one token, so every substring of every token of up
+    to CONTAINMENT_MAX_TOKEN_LENGTH characters is kept in a refcounted set and answered with one
+    lookup; longer tokens, whose substrings grow quadratically, are scanned instead. Other queries
+    scan a newline-joined copy of the phrases. Scanned buffers are rebuilt only after a change.
+    """
+
+    def __init__(self):
+        self.phrases = Counter()
+        self.substrings = Counter()
+        self.long_tokens = Counter()
+        self._buffer = None
+        self._long_buffer = None
+
+    @staticmethod
+    def split_tokens(phrase):
+        """Return (substrings of the short tokens, long tokens) of phrase."""
+        substrings = set()
+        long_tokens = set()
+        for token in phrase.split(' '):
+            if len(token) > CONTAINMENT_MAX_TOKEN_LENGTH:
+                long_tokens.add(token)
+                continue
+            substrings.update(token[start:end]
+                              for start in range(len(token))
+                              for end in range(start + 1, len(token) + 1))
+        return substrings, long_tokens
+
+    @staticmethod
+    def discard(counter, keys):
+        for key in keys:
+            if counter[key] == 1:
+                del counter[key]
+            else:
+                counter[key] -= 1
+
+    def add(self, phrase):
+        self.phrases[phrase] += 1
+        if self.phrases[phrase] == 1:
+            substrings, long_tokens = self.split_tokens(phrase)
+            self.substrings.update(substrings)
+            if long_tokens:
+                self.long_tokens.update(long_tokens)
+                self._long_buffer = None
+            self._buffer = None
+
+    def remove(self, phrase):
+        self.phrases[phrase] -= 1
+        if self.phrases[phrase] == 0:
+            del self.phrases[phrase]
+            substrings, long_tokens = self.split_tokens(phrase)
+            self.discard(self.substrings, substrings)
+            if long_tokens:
+                self.discard(self.long_tokens, long_tokens)
+                self._long_buffer = None
+            self._buffer = None
+
+    def __contains__(self, query):
+        if not query:
+            return bool(self.phrases)
+        if ' ' not in query and '\n' not in query:
+            if query in self.substrings:
+                return True
+            if not self.long_tokens:
+                return False
+            if self._long_buffer is None:
+                self._long_buffer = '\n'.join(self.long_tokens)
+            return query in self._long_buffer
+        if self._buffer is None:
+            self._buffer = '\n'.join(self.phrases)
+        return query in self._buffer
+
+def select_common_phrases(counter, comments, top_n=10):
+    """Select the top_n most frequent phrases from a PhraseCounter filled with comments."""
+    vocab = PhraseVocab.from_counter(counter)
+    return vocab.phrases(select_common_phrase_ids(vocab, comments, top_n))
+
+def select_common_phrase_ids(vocab, comments, top_n=10):
+    """select_common_phrases on a PhraseVocab, returning phrase ids."""
+    min_occurrences = min(30, max(math.ceil(len(comments) / 40), 2))
     
-    sorted_phrases = sorted(ngram_counts.items(), key=lambda x: len(x[0].split()), reverse=True)
+    # Phrases seen once can never pass, so only repeated ones are sorted. The threshold still drops
+    # one level at a time as before; phrases below the starting one are bucketed by count and merged
+    # into the eligible list when it reaches their level, and levels adding nothing are skipped.
+    sorted_ids = sorted(
+        (phrase_id for phrase_id in range(len(vocab)) if vocab.counts[phrase_id] >= 2),
+        key=vocab.key_lengths.__getitem__,
+        reverse=True
+    )
+    eligible = []
+    buckets = defaultdict(list)
+    for index, phrase_id in enumerate(sorted_ids):
+        count = vocab.counts[phrase_id]
+        if count >= min_occurrences:
+            eligible.append(index)
+        else:
+            buckets[count].append(index)
     
-    min_occurrences = min(30, max(math.ceil(len(comments) / 40), 2))
-    all_common_phrases = set()
+    # Kept phrases in the order they were kept, and the lowercase forms among them
+    all_common_phrases = {}
     all_common_phrases_lower = set()
+    common_index = ContainmentIndex()
+    changed = True
     
     while min_occurrences >= 2 and len(all_common_phrases) < top_n:
+        if min_occurrences in buckets:
+            eligible = sorted(eligible + buckets.pop(min_occurrences))
+        elif not changed:
+            # Same candidates and same kept phrases as the last level, so it would change nothing
+            min_occurrences -= 1
+            continue
+        changed = False
+        
         filtered_phrases = []
+        filtered_index = ContainmentIndex()
         
-        for phrase_lower, count in sorted_phrases:
-            if count >= min_occurrences and phrase_lower not in all_common_phrases_lower:
-                phrase = normalized_to_original[phrase_lower]
-                if ' ' in phrase:
-                    filtered_phrases.append(phrase)
+        for index in eligible:
+            phrase_id = sorted_ids[index]
+            if vocab.key_forms[phrase_id] not in all_common_phrases_lower and vocab.lengths[phrase_id] > 1:
+                filtered_phrases.append(phrase_id)
+                filtered_index.add(vocab.lowers[phrase_id])
         
-        for phrase_lower, count in sorted_phrases:
-            if count >= min_occurrences and phrase_lower not in all_common_phrases_lower:
-                phrase = normalized_to_original[phrase_lower]
-                if ' ' not in phrase:
-                    if not any(phrase_lower in p.lower() for p in filtered_phrases) and \
-                       not any(phrase_lower in p.lower() for p in all_common_phrases):
-                        filtered_phrases.append(phrase)
+        for index in eligible:
+            phrase_id = sorted_ids[index]
+            if vocab.key_forms[phrase_id] not in all_common_phrases_lower and vocab.lengths[phrase_id] == 1:
+                key = vocab.keys[phrase_id]
+                if key not in filtered_index and key not in common_index:
+                    filtered_phrases.append(phrase_id)
+                    filtered_index.add(vocab.lowers[phrase_id])
         
         if not filtered_phrases:
             min_occurrences -= 1
@@ -363,23 +2204,24 @@ def extract_filtered_phrases(comments, min_ngram=1, max_ngram=5, top_n=10, apply
         
         filtered_phrases_sorted = sorted(
             filtered_phrases,
-            key=lambda phrase: ngram_counts[phrase.lower()],
+            key=vocab.rank_counts.__getitem__,
             reverse=True
         )
         
-        for phrase in filtered_phrases_sorted:
-            phrase_lower = phrase.lower()
+        for phrase_id in filtered_phrases_sorted:
+            phrase_lower = vocab.lowers[phrase_id]
+            phrase_length = vocab.lengths[phrase_id]
             
-            phrases_to_remove = set()
+            phrases_to_remove = []
             skip_current = False
             
             for existing in all_common_phrases:
-                existing_lower = existing.lower()
+                existing_lower = vocab.lowers[existing]
                 
                 if existing_lower in phrase_lower or phrase_lower in existing_lower:
-                    if len(phrase_lower.split()) > len(existing_lower.split()):
-                        phrases_to_remove.add(existing)
-                        all_common_phrases_lower.remove(existing_lower)
+                    if phrase_length > vocab.lengths[existing]:
+                        phrases_to_remove.append(existing)
+                        all_common_phrases_lower.remove(vocab.lower_forms[existing])
                     else:
                         skip_current = True
                         break
@@ -387,11 +2229,15 @@ def extract_filtered_phrases(comments, min_ngram=1, max_ngram=5, top_n=10, apply
             if skip_current:
                 continue
                 
-            all_common_phrases.difference_update(phrases_to_remove)
+            for removed in phrases_to_remove:
+                del all_common_phrases[removed]
+                common_index.remove(vocab.lowers[removed])
             
             if len(all_common_phrases) < top_n or phrases_to_remove:
-                all_common_phrases.add(phrase)
-                all_common_phrases_lower.add(phrase_lower)
+                all_common_phrases[phrase_id] = None
+                all_common_phrases_lower.add(vocab.lower_forms[phrase_id])
+                common_index.add(phrase_lower)
+                changed = True
         
         logger.info(f"Applied min_occurrences={min_occurrences}, found {len(filtered_phrases_sorted)} phrases.")
 
@@ -399,14 +2245,14 @@ def extract_filtered_phrases(comments, min_ngram=1, max_ngram=5, top_n=10, apply
 
     if not all_common_phrases:
         logger.warning("No common phrases found. Returning all unique words.")
-        all_words = set()
-        for comment in comments:
-            all_words.update(comment['text'].split())
-        all_common_phrases = set(list(all_words)[:top_n])
+        all_words = {}
+        for text in comment_texts(comments):
+            all_words.update(dict.fromkeys(text.split()))
+        all_common_phrases = dict.fromkeys(vocab.add(word) for word in list(all_words)[:top_n])
     
     top_phrases = sorted(
         all_common_phrases,
-        key=lambda phrase: ngram_counts[phrase.lower()],
+        key=vocab.rank_counts.__getitem__,
         reverse=True
     )[:top_n]
     
@@ -414,26 +2260,86 @@ def extract_filtered_phrases(comments, min_ngram=1, max_ngram=5, top_n=10, apply
     
     return top_phrases
 
+class PhraseMatcher:
+    """Finds which of a fixed list of phrases occur in a text, in order of first appearance.
+
+    Matching is case-insensitive substring matching. For long phrase lists, a regex built from a
+    character trie of the phrases finds every offset where some phrase starts in one scan of the
+    text, and the trie is walked from those offsets to collect all phrases starting there. Short
+    lists are cheaper to check with one str.find per phrase.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = []
+        self.phrases_lower = []
+        self.indices = []
+        self.trie = {}
+        seen = set()
+        for input_index, phrase in enumerate(phrases):
+            phrase_lower = phrase.lower()
+            if phrase_lower in seen:
+                continue
+            seen.add(phrase_lower)
+            node = self.trie
+            for char in phrase_lower:
+                node = node.setdefault(char, {})
+            node[None] = len(self.phrases)
+            self.phrases.append(phrase)
+            self.phrases_lower.append(phrase_lower)
+            self.indices.append(input_index)
+        # Each match consumes only the phrase's first character, so overlapping occurrences are
+        # still found while the regex engine can skip ahead on that character
+        self.regex = re.compile('|'.join(
+            re.escape(char) + (f'(?={rest})' if rest else '')
+            for char, rest in ((char, self._pattern(child)) for char, child in self.trie.items() if char is not None)
+        ), re.DOTALL)
+
+    @classmethod
+    def _pattern(cls, node):
+        if None in node:
+            return ''
+        branches = [re.escape(char) + cls._pattern(child) for char, child in node.items()]
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    def positions(self, text):
+        """Map each phrase found in text to its 1-based rank by first occurrence.
+
+        Phrases first found at the same offset are ranked in list order.
+        """
+        return {self.phrases[index]: rank for rank, index in enumerate(self._found(text), 1)}
+
+    def matches(self, text):
+        """Indices into the phrases the matcher was built from of those found in text, by rank."""
+        return [self.indices[index] for index in self._found(text)]
+
+    def _found(self, text):
+        text_lower = text.lower()
+        if len(self.phrases) < PHRASE_MATCHER_MIN_PHRASES:
+            hits = [(text_lower.find(phrase_lower), index) for index, phrase_lower in enumerate(self.phrases_lower)
+                    if phrase_lower in text_lower]
+            hits.sort()
+            return [index for _, index in hits]
+
+        found = {}
+        for match in self.regex.finditer(text_lower):
+            node = self.trie
+            starting_here = []
+            for offset in range(match.start(), len(text_lower)):
+                node = node.get(text_lower[offset])
+                if node is None:
+                    break
+                index = node.get(None)
+                if index is not None and index not in found:
+                    starting_here.append(index)
+            for index in sorted(starting_here):
+                found[index] = None
+            if len(found) == len(self.phrases):
+                break
+        return list(found)
+
 def find_phrase_positions(comment_text, phrases):
     """Find sequential positions of phrases based on order of appearance"""
-    positions = {}
-    current_position = 1
-    comment_lower = comment_text.lower()
-    seen_phrases = set()
-    remaining_phrases = len(phrases)
-    
-    for phrase in phrases:
-        phrase_lower = phrase.lower()
-        if phrase_lower in comment_lower and phrase_lower not in seen_phrases:
-            positions[phrase] = current_position
-            current_position += 1
-            seen_phrases.add(phrase_lower)
-            remaining_phrases -= 1
-            
-            if remaining_phrases == 0:
-                break
-    
-    return positions
+    return PhraseMatcher(phrases).positions(comment_text)
 
 def calculate_phrase_score(upvotes, position, alpha=0.1):
     """Calculate score using the formula: Score = Upvotes / (Position ^ alpha)"""
@@ -441,32 +2347,141 @@ def calculate_phrase_score(upvotes, position, alpha=0.1):
         return 0
     return upvotes / (position ** alpha)
 
-def compute_phrase_scores(phrases, comments):
+def compute_phrase_scores(phrases, comments, alpha=DEFAULT_ALPHA):
     """Compute scores for phrases based on sequential position and upvotes"""
-    phrase_scores = defaultdict(float)
+    phrases = list(phrases)
+    phrase_scores, total_upvotes = compute_phrase_index_scores(phrases, comments, alpha)
+    return rekey(phrase_scores, phrases), rekey(total_upvotes, phrases)
+
+def compute_phrase_index_scores(phrases, comments, alpha=DEFAULT_ALPHA):
+    """compute_phrase_scores keyed by index into phrases."""
+    scores_by_alpha, total_upvotes = compute_phrase_index_scores_multi(phrases, comments, [alpha])
+    return scores_by_alpha[0], total_upvotes
+
+def compute_phrase_index_scores_multi(phrases, comments, alphas):
+    """Return ([phrase_scores per alpha], total_upvotes) keyed by index into phrases.
+
+    Comments are matched once whatever the number of alphas, with the configured backend.
+    """
+    pool = get_extract_pool() if len(comments) >= SHARD_MIN_COMMENTS else None
+    if SCORING_BACKEND == 'numpy' and np is not None:
+        return compute_phrase_scores_numpy(phrases, comments, alphas, pool)
+
+    if pool is not None:
+        try:
+            return compute_phrase_scores_sharded(phrases, comments, pool, alphas)
+        except Exception as e:
+            logger.warning(f"Sharded phrase scoring failed, scoring in-process: {str(e)}")
+    return score_comments(phrases, comments, alphas)
+
+def rekey(values, keys):
+    """Replace the index keys of a defaultdict of scores with keys[index]."""
+    return defaultdict(values.default_factory, ((keys[index], value) for index, value in values.items()))
+
+def score_comments(phrases, comments, alphas=(DEFAULT_ALPHA,)):
+    """Single-process body of compute_phrase_index_scores_multi, also run by each shard worker."""
+    scores_by_alpha = [defaultdict(float) for _ in alphas]
     phrase_total_upvotes = defaultdict(int)
+    matcher = PhraseMatcher(phrases)
     
-    for comment in comments:
-        positions = find_phrase_positions(comment['text'], phrases)
-        
-        for phrase, position in positions.items():
-            score = calculate_phrase_score(
-                upvotes=max(1, comment['score']),
-                position=position
-            )
-            phrase_scores[phrase] += score
-            phrase_total_upvotes[phrase] += max(1, comment['score'])
+    texts, scores = comment_columns(comments)
     
-    return phrase_scores, phrase_total_upvotes
+    for text, comment_score in zip(texts, scores):
+        for position, index in enumerate(matcher.matches(text), 1):
+            for alpha, phrase_scores in zip(alphas, scores_by_alpha):
+                phrase_scores[index] += calculate_phrase_score(
+                    upvotes=max(1, comment_score),
+                    position=position,
+                    alpha=alpha
+                )
+            phrase_total_upvotes[index] += max(1, comment_score)
+    
+    return scores_by_alpha, phrase_total_upvotes
 
-def is_substring_of_any(phrase, other_phrases):
-    """Check if phrase is a substring of any other phrase or contains any other phrase"""
-    phrase_lower = phrase.lower()
-    for other in other_phrases:
-        other_lower = other.lower()
-        if (phrase_lower in other_lower or other_lower in phrase_lower) and phrase_lower != other_lower:
-            return True
-    return False
+def compute_phrase_scores_sharded(phrases, comments, pool, alphas=(DEFAULT_ALPHA,)):
+    """Score contiguous shards of comments on pool and sum the partial maps in shard order.
+
+    Phrases keep the order in which they were first scored, as in the single-process loop.
+    """
+    if not isinstance(comments, CommentBatch):
+        comments = CommentBatch.from_records(comments)
+    shards = split_shards(comments, EXTRACT_WORKERS)
+    futures = [pool.submit(score_comments, phrases, shard, alphas) for _, shard in shards]
+    scores_by_alpha = [defaultdict(float) for _ in alphas]
+    phrase_total_upvotes = defaultdict(int)
+    for future in futures:
+        shard_scores_by_alpha, shard_upvotes = future.result()
+        for phrase_scores, shard_scores in zip(scores_by_alpha, shard_scores_by_alpha):
+            for index, score in shard_scores.items():
+                phrase_scores[index] += score
+        for index, upvotes in shard_upvotes.items():
+            phrase_total_upvotes[index] += upvotes
+    return scores_by_alpha, phrase_total_upvotes
+
+def match_phrase_positions(phrases, texts, offset=0):
+    """COO triplets (comment, phrase, position) of the phrases matched in texts, numbered from offset.
+
+    The matching part of compute_phrase_scores_numpy, also run by each shard worker.
+    """
+    matcher = PhraseMatcher(phrases)
+    rows, cols, positions = array('l'), array('l'), array('l')
+    for row, text in enumerate(texts, offset):
+        for position, index in enumerate(matcher.matches(text), 1):
+            rows.append(row)
+            cols.append(index)
+            positions.append(position)
+    return rows, cols, positions
+
+def compute_phrase_scores_numpy(phrases, comments, alphas, pool=None):
+    """Score phrases for several alphas at once from a sparse comment x phrase position matrix.
+
+    The matrix is kept as COO triplets (comment, phrase, position); each alpha is then a single
+    weighted bincount over the phrase column. Returns ([phrase_scores per alpha], total_upvotes),
+    keyed by index into phrases in the order they are first scored, as score_comments does.
+    With a pool, contiguous shards of comments are matched on it and the triplets concatenated.
+    """
+    texts, scores = comment_columns(comments)
+    rows, cols, positions = None, None, None
+    if pool is not None:
+        try:
+            futures = [pool.submit(match_phrase_positions, phrases, shard, offset)
+                       for offset, shard in split_shards(texts, EXTRACT_WORKERS)]
+            rows, cols, positions = array('l'), array('l'), array('l')
+            for future in futures:
+                shard_rows, shard_cols, shard_positions = future.result()
+                rows.extend(shard_rows)
+                cols.extend(shard_cols)
+                positions.extend(shard_positions)
+        except Exception as e:
+            logger.warning(f"Sharded phrase matching failed, matching in-process: {str(e)}")
+            rows = None
+    if rows is None:
+        rows, cols, positions = match_phrase_positions(phrases, texts)
+
+    if not rows:
+        return [defaultdict(float) for _ in alphas], defaultdict(int)
+
+    cols = np.array(cols, dtype=np.intp)
+    positions = np.array(positions, dtype=np.float64)
+    upvotes = np.maximum(1, np.asarray(scores, dtype=np.int64))
+    weights = upvotes[np.array(rows, dtype=np.intp)].astype(np.float64)
+
+    _, first_seen = np.unique(cols, return_index=True)
+    order = cols[np.sort(first_seen)].tolist()
+    num_phrases = len(phrases)
+
+    total_upvotes = np.bincount(cols, weights=weights, minlength=num_phrases)
+    phrase_total_upvotes = defaultdict(int, ((i, int(total_upvotes[i])) for i in order))
+    scores_by_alpha = []
+    for alpha in alphas:
+        scores = np.bincount(cols, weights=weights / positions ** alpha, minlength=num_phrases)
+        scores_by_alpha.append(defaultdict(float, ((i, float(scores[i])) for i in order)))
+    return scores_by_alpha, phrase_total_upvotes
+
+def compute_phrase_id_scores_multi(vocab, phrase_ids, comments, alphas):
+    """Return ([phrase_scores per alpha], total_upvotes) keyed by the vocab ids in phrase_ids."""
+    scores_by_alpha, total_upvotes = compute_phrase_index_scores_multi(vocab.phrases(phrase_ids), comments, alphas)
+    return [rekey(phrase_scores, phrase_ids) for phrase_scores in scores_by_alpha], rekey(total_upvotes, phrase_ids)
 
 def is_incomplete_phrase(phrase):
     """Check if phrase ends with connecting words using regex."""
@@ -474,32 +2489,56 @@ def is_incomplete_phrase(phrase):
 
 def top_phrases_combined(phrases, comments, top_n=10, min_length=1, max_length=5):
     """Get top phrases using position-based scoring with substring deduplication"""
-    phrase_scores, total_upvotes = compute_phrase_scores(phrases, comments)
-    
-    sorted_phrases = sorted(
-        phrase_scores.items(), 
-        key=lambda x: x[1],
-        reverse=True
-    )
-    
-    final_phrases = []
-    seen_phrases = set()
-    
-    for phrase, score in sorted_phrases:
-        phrase_length = len(phrase.split())
-        if (min_length <= phrase_length <= max_length and
-            not is_incomplete_phrase(phrase) and
-            phrase.lower() not in seen_phrases and 
-            not is_substring_of_any(phrase, final_phrases)):
-            
-            final_phrases.append(phrase)
-            seen_phrases.add(phrase.lower())
-            
-            if len(final_phrases) >= top_n:
-                break
-    
-    return [(phrase, phrase_scores[phrase], total_upvotes[phrase]) 
-            for phrase in final_phrases[:top_n]]
+    vocab, phrase_ids = PhraseVocab.from_phrases(phrases)
+    return [(vocab.originals[phrase_id], score, upvotes)
+            for phrase_id, score, upvotes in top_phrase_ids(vocab, phrase_ids, comments, top_n, min_length, max_length)]
+
+def top_phrase_ids(vocab, phrase_ids, comments, top_n=10, min_length=1, max_length=5):
+    """top_phrases_combined on vocab ids, returning (id, score, upvotes) rows."""
+    phrase_scores, total_upvotes = compute_phrase_index_scores(vocab.phrases(phrase_ids), comments)
+    return rank_phrase_ids(vocab, rekey(phrase_scores, phrase_ids), rekey(total_upvotes, phrase_ids),
+                           top_n, min_length, max_length)
+
+def rank_phrase_ids(vocab, phrase_scores, total_upvotes, top_n=10, min_length=1, max_length=5):
+    """Pick the top_n highest scoring vocab ids, skipping incomplete phrases and substring duplicates."""
+    return PhraseRanker(vocab, phrase_scores, total_upvotes, min_length, max_length).next_page(top_n)
+
+class PhraseRanker:
+    """Hands out the highest scoring phrases that pass the ranking filters, one page at a time.
+
+    Candidates sit in a heap keyed by (-score, scoring order), so a page only pops and filters as
+    many as it needs, and the next page carries on from there without rescoring. Equal scores keep
+    the order in which the phrases were scored, as a stable sort would.
+    """
+
+    def __init__(self, vocab, phrase_scores, total_upvotes, min_length=1, max_length=5):
+        self.vocab = vocab
+        self.phrase_scores = phrase_scores
+        self.total_upvotes = total_upvotes
+        self.min_length = min_length
+        self.max_length = max_length
+        self.heap = [(-score, order, phrase_id) for order, (phrase_id, score) in enumerate(phrase_scores.items())]
+        heapq.heapify(self.heap)
+        self.seen_phrases = set()
+
+    def accepts(self, phrase_id):
+        """Whether phrase_id has the right length, is complete and overlaps no phrase already ranked."""
+        vocab = self.vocab
+        if not self.min_length <= vocab.lengths[phrase_id] <= self.max_length or vocab.incomplete[phrase_id]:
+            return False
+        phrase_lower = vocab.lowers[phrase_id]
+        return (phrase_lower not in self.seen_phrases and
+                not any(phrase_lower in other or other in phrase_lower for other in self.seen_phrases))
+
+    def next_page(self, top_n=10):
+        """Return the next top_n (id, score, upvotes) rows."""
+        rows = []
+        while self.heap and len(rows) < top_n:
+            _, _, phrase_id = heapq.heappop(self.heap)
+            if self.accepts(phrase_id):
+                self.seen_phrases.add(self.vocab.lowers[phrase_id])
+                rows.append((phrase_id, self.phrase_scores[phrase_id], self.total_upvotes[phrase_id]))
+        return rows
 
 def get_memory_usage():
     """Get current memory usage in MB"""
@@ -543,8 +2582,9 @@ def process_titles(titles: List[str]) -> dict:
 
 @app.route('/api/top_phrases', methods=['POST'])
 def get_top_reddit_phrases():
+    metrics = RequestMetrics()
     try:
-        total_start_time = time.time()
+        total_start_time = metrics.start
         memory_start = get_memory_usage()
         
         data = request.json
@@ -562,92 +2602,134 @@ def get_top_reddit_phrases():
         custom_words_input = data.get('custom_words', '')
         custom_words = set(custom_words_input.lower().split(',')) if custom_words_input else set()
         apply_remove_lowercase = data.get('apply_remove_lowercase', True)
+        approximate = bool(data.get('approximate', False))
+        max_total_comments = APPROX_MAX_TOTAL_COMMENTS if approximate else MAX_TOTAL_COMMENTS
+        alphas = data.get('alphas')
+        if alphas is not None:
+            try:
+                alphas = [float(alpha) for alpha in alphas][:MAX_ALPHAS]
+            except (TypeError, ValueError):
+                return jsonify({"error": "alphas must be a list of numbers"}), 400
+        metrics.fields.update(
+            num_urls=len(urls), top_n=top_n, min_ngram=min_ngram, max_ngram=max_ngram,
+            custom_words=len(custom_words_input.split(',')) if custom_words_input else 0,
+            approximate=int(approximate)
+        )
 
-        # Step 1: Fetch Reddit JSON
-        fetch_start = time.time()
+        result_params = {
+            # Duplicates stay: a thread listed twice is counted twice
+            'threads': sorted(get_submission_id(url) or url for url in urls),
+            'top_n': top_n,
+            'min_ngram': min_ngram,
+            'max_ngram': max_ngram,
+            'custom_words': sorted(custom_words),
+            'apply_remove_lowercase': bool(apply_remove_lowercase),
+            'approximate': approximate,
+            'alphas': alphas
+        }
+        versions = thread_versions(result_params['threads']) if result_cache else None
+        if versions is not None:
+            cached = result_cache.get(ResultCache.make_key(result_params, versions))
+            if cached is not None:
+                logger.info(f"Serving cached result for {len(urls)} URLs")
+                log_performance_metrics(metrics.row('cached'))
+                return jsonify({**cached, 'topic': process_titles(titles)['topic']})
+
+        # Steps 1-3 run as a pipeline: each thread is cleaned and counted as soon as it arrives
+        # while the remaining threads are still being fetched.
+        pipeline_start = time.time()
         logger.info(f"Step (1/4): Fetching Reddit JSON data for {len(urls)} URLs...")
-        all_comments = []
+        comment_batches = []
         total_comments = 0
         
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_url = {executor.submit(get_reddit_data, url): url for url in urls}
-            for future in as_completed(future_to_url):
-                if time.time() - total_start_time > VERCEL_TIMEOUT:
-                    logger.warning("Approaching Vercel timeout limit, processing with current comments")
+        unexpanded_comments = 0
+        fetched_versions = []
+        request_token_cache = TokenCache() if TOKEN_CACHE_SCOPE == 'request' else None
+        phrase_counter = PhraseCounter(min_ngram, max_ngram, apply_remove_lowercase, custom_words,
+                                       token_cache=request_token_cache,
+                                       capacity=APPROX_COUNTER_CAPACITY if approximate else None)
+        
+        for url, reddit_data in iter_reddit_data(urls, deadline=total_start_time + VERCEL_TIMEOUT,
+                                                 fetch_times=metrics.fetch_times):
+            if reddit_data and 'comments' in reddit_data:
+                fetched_versions.append((get_submission_id(url) or url, reddit_data.get('version')))
+                unexpanded_comments += reddit_data.get('unexpanded', 0)
+                new_comments = reddit_data['comments']
+                remaining_space = max_total_comments - total_comments
+                if remaining_space > 0:
+                    if len(new_comments) > remaining_space:
+                        new_comments = new_comments[:remaining_space]
+
+                    # Step 2: Clean Comments
+                    with metrics.span('clean'):
+                        new_comments = new_comments.with_texts(clean_texts(new_comments.texts()))
+
+                    # Step 3: Count phrases
+                    with metrics.span('count'):
+                        if thread_count_cache and len(new_comments) == len(reddit_data['comments']):
+                            thread_count_cache.add_to(phrase_counter, get_submission_id(url), new_comments)
+                        else:
+                            phrase_counter.add(new_comments)
+
+                    comment_batches.append(new_comments)
+                    total_comments += len(new_comments)
+                
+                if total_comments >= max_total_comments:
+                    logger.warning(f"Reached maximum total comments limit ({max_total_comments})")
                     break
-                    
-                url = future_to_url[future]
-                try:
-                    reddit_data = future.result(timeout=2)
-                    if reddit_data and 'comments' in reddit_data:
-                        new_comments = reddit_data['comments']
-                        remaining_space = MAX_TOTAL_COMMENTS - total_comments
-                        if remaining_space > 0:
-                            new_comments = new_comments[:remaining_space]
-                            all_comments.extend(new_comments)
-                            total_comments += len(new_comments)
-                        
-                        if total_comments >= MAX_TOTAL_COMMENTS:
-                            logger.warning(f"Reached maximum total comments limit ({MAX_TOTAL_COMMENTS})")
-                            break
-                except Exception as e:
-                    logger.warning(f"Error processing {url}: {str(e)}")
-                    continue
         
-        fetch_time = time.time() - fetch_start
-        logger.info(f"Step 1 - Fetch time: {fetch_time:.2f}s, Comments: {len(all_comments)}")
+        clean_time = metrics.spans['clean']
+        count_time = metrics.spans['count']
+        fetch_time = metrics.spans['fetch'] = time.time() - pipeline_start - clean_time - count_time
+        all_comments = CommentBatch.concat(comment_batches)
+        metrics.counters.update(total_comments=len(all_comments), unexpanded_comments=unexpanded_comments)
+        logger.info(f"Step 1 - Fetch wait time: {fetch_time:.2f}s, Comments: {len(all_comments)}, Unexpanded: {unexpanded_comments}")
+        logger.info(f"Step 1 - Fetch time per URL: {', '.join(f'{url}: {seconds:.2f}s' for url, seconds in metrics.fetch_times.items())}")
+        logger.info(f"Step 2 - Clean time: {clean_time:.2f}s")
 
         if not all_comments:
+            log_performance_metrics(metrics.row('no_comments'))
             return jsonify({"error": "No comments found in the provided URLs"}), 404
-            
-        if len(all_comments) > MAX_TOTAL_COMMENTS:
-            logger.warning(f"Truncating {len(all_comments)} comments to {MAX_TOTAL_COMMENTS}")
-            all_comments.sort(key=lambda x: x['score'], reverse=True)
-            all_comments = all_comments[:MAX_TOTAL_COMMENTS]
-
-        logger.info(f"Total comments after truncation: {len(all_comments)}")
-
-        logger.info("Done.")
-
-        # Step 2: Clean Comments
-        clean_start = time.time()
-        logger.info("Step (2/4): Cleaning comments...")
-        for comment in all_comments:
-            comment['text'] = clean_text(comment['text'])
-        clean_time = time.time() - clean_start
-        logger.info(f"Step 2 - Clean time: {clean_time:.2f}s")
 
         # Step 3: Extract Common Phrases
-        extract_start = time.time()
         logger.info("Step (3/4): Extracting common phrases...")
         
-        all_common_phrases = extract_filtered_phrases(
-            comments=all_comments,
-            min_ngram=min_ngram,
-            max_ngram=max_ngram,
-            top_n=top_n,
-            apply_remove_lowercase=apply_remove_lowercase,
-            custom_words=custom_words
-        )
+        with metrics.span('select'):
+            vocab = PhraseVocab.from_counter(phrase_counter)
+            common_phrase_ids = select_common_phrase_ids(vocab, all_comments, top_n=top_n)
+        metrics.counters.update(ngrams=len(vocab.ngram_counts), candidates=len(vocab), count_error=phrase_counter.count_error)
         
-        total_extract_time = time.time() - extract_start
+        total_extract_time = metrics.spans['extract'] = count_time + metrics.spans['select']
         logger.info(f"Step 3 - Total extraction time: {total_extract_time:.2f}s")
+        if approximate:
+            logger.info(f"Step 3 - Approximate counts kept: {len(phrase_counter.stats)}, max count error: {phrase_counter.count_error}")
 
         # Step 4: Score and Rank
-        score_start = time.time()
         logger.info("Step (4/4): Calculating top phrases...")
-        top_phrases = top_phrases_combined(
-            all_common_phrases, 
-            all_comments, 
-            top_n=top_n,
-            min_length=min_ngram,
-            max_length=max_ngram
-        )
-        score_time = time.time() - score_start
+        with metrics.span('score'):
+            # The default ranking and every requested alpha come from one matching pass
+            scores_by_alpha, total_upvotes = compute_phrase_id_scores_multi(
+                vocab, common_phrase_ids, all_comments, [DEFAULT_ALPHA] + (alphas or [])
+            )
+            top_phrases = rank_phrase_ids(vocab, scores_by_alpha[0], total_upvotes, top_n, min_ngram, max_ngram)
+            rankings = None
+            if alphas:
+                rankings = [
+                    {
+                        'alpha': alpha,
+                        'phrases': [
+                            {'phrase': vocab.originals[phrase_id], 'score': f'{score:.2f}', 'upvotes': upvotes}
+                            for phrase_id, score, upvotes in rank_phrase_ids(vocab, phrase_scores, total_upvotes, top_n, min_ngram, max_ngram)
+                        ]
+                    }
+                    for alpha, phrase_scores in zip(alphas, scores_by_alpha[1:])
+                ]
+        score_time = metrics.spans['score']
         logger.info(f"Step 4 - Scoring time: {score_time:.2f}s")
 
-        total_time = time.time() - total_start_time
+        total_time = metrics.spans['total'] = time.time() - total_start_time
         memory_used = get_memory_usage() - memory_start
+        metrics.fields['memory_used'] = f'{memory_used:.1f}'
         
         logger.info("\nPerformance Summary:")
         logger.info(f"Total time: {total_time:.2f}s")
@@ -657,11 +2739,18 @@ def get_top_reddit_phrases():
         logger.info(f"  - Score: {score_time:.2f}s ({(score_time/total_time)*100:.1f}%)")
         logger.info(f"Memory usage: {memory_used:.1f}MB")
         logger.info(f"Comments processed: {len(all_comments)}")
+        if comment_cache:
+            logger.info(f"Comment cache: {comment_cache.stats()}")
+        if result_cache:
+            logger.info(f"Result cache: {result_cache.stats()}")
+        if thread_count_cache:
+            logger.info(f"N-gram count cache: {thread_count_cache.stats()}")
+        logger.info(f"Token cache: {(request_token_cache or token_cache).stats()}")
 
         result = []
-        for idx, (phrase, score, upvotes) in enumerate(top_phrases, 1):
+        for idx, (phrase_id, score, upvotes) in enumerate(top_phrases, 1):
             result.append({
-                'phrase': phrase,
+                'phrase': vocab.originals[phrase_id],
                 'score': f'{score:.2f}',
                 'upvotes': upvotes
             })
@@ -675,35 +2764,59 @@ def get_top_reddit_phrases():
 
         logger.info(f"Returning result: {result}")
 
-        # metrics = {
-        #     'total_comments': len(all_comments),
-        #     'num_urls': len(urls),
-        #     'top_n': top_n,
-        #     'min_ngram': min_ngram,
-        #     'max_ngram': max_ngram,
-        #     'custom_words': len(custom_words_input.split(',')) if custom_words_input else 0,
-        #     'total_time': total_time,
-        #     'fetch_time': fetch_time,
-        #     'clean_time': clean_time,
-        #     'extract_time': total_extract_time,
-        #     'score_time': score_time,
-        #     'memory_used': memory_used
-        # }
-        # log_performance_metrics(metrics)
+        metrics.counters['phrases'] = len(result)
+        log_performance_metrics(metrics.row('ok'))
 
-        return jsonify({
+        response = {
             'phrases': result,
             'topic': topic_info['topic'],
             'warning': response_data.get('warning', None)
-        })
+        }
+        if rankings is not None:
+            response['rankings'] = rankings
+        if approximate:
+            response['count_error'] = phrase_counter.count_error
+        # Key the result by the snapshots it was computed from, in the order of result_params['threads'];
+        # a snapshot stored since by another request must not be taken as this result's input
+        if result_cache and len(fetched_versions) == len(urls):
+            versions = [version for _, version in sorted(fetched_versions, key=lambda pair: pair[0])]
+            if not comment_cache or None not in versions:
+                result_cache.set(ResultCache.make_key(result_params, versions),
+                                 {key: value for key, value in response.items() if key != 'topic'})
+        return jsonify(response)
 
     except Exception as e:
         error_msg = str(e)
         if "timeout" in error_msg.lower() or "socket" in error_msg.lower():
             error_msg = "Request timed out. Try reducing the number of threads or selecting threads with fewer comments."
         logger.error("An error occurred:", exc_info=True)
+        log_performance_metrics(metrics.row('error'))
         return jsonify({"error": error_msg}), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Percentiles of the metrics of recent /api/top_phrases requests."""
+    try:
+        limit = max(1, int(request.args.get('limit', METRICS_WINDOW)))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    rows = read_performance_metrics(limit)
+    response = {
+        'requests': len(rows),
+        'statuses': dict(Counter(row.get('status') or 'unknown' for row in rows)),
+        'metrics': summarize_metrics(rows),
+        'token_cache': token_cache.stats()
+    }
+    if comment_cache:
+        response['comment_cache'] = comment_cache.stats()
+    if result_cache:
+        response['result_cache'] = result_cache.stats()
+    if thread_count_cache:
+        response['ngram_cache'] = thread_count_cache.stats()
+    response['post_info_cache'] = post_info_cache.stats()
+    return jsonify(response)
+
 @app.route('/api/post_info', methods=['POST'])
 def get_post_info():
     try:
@@ -715,17 +2828,48 @@ def get_post_info():
         if not submission_id:
             return jsonify({"error": "Invalid Reddit URL"}), 400
 
-        submission = reddit.submission(id=submission_id)
-        
+        info = get_post_info_batch([submission_id]).get(submission_id)
+        if info is None:
+            return jsonify({"error": "Post not found"}), 404
+
         return jsonify({
-            "title": submission.title,
-            "numComments": submission.num_comments
+            "title": info['title'],
+            "numComments": info['num_comments']
         })
 
     except Exception as e:
         logger.error(f"Error fetching post info: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/post_info/batch', methods=['POST'])
+def get_post_info_bulk():
+    """Title and comment count of many threads, from cache or a single /api/info request per 100."""
+    try:
+        data = request.json
+        urls = data.get('urls') if data else None
+        if not urls or not isinstance(urls, list):
+            return jsonify({"error": "URLs are required"}), 400
+        if len(urls) > MAX_POST_INFO_URLS:
+            return jsonify({"error": f"At most {MAX_POST_INFO_URLS} URLs are allowed"}), 400
+
+        submission_ids = [get_submission_id(url) if isinstance(url, str) else None for url in urls]
+        infos = get_post_info_batch([submission_id for submission_id in submission_ids if submission_id])
+
+        posts = []
+        for url, submission_id in zip(urls, submission_ids):
+            info = infos.get(submission_id)
+            if not submission_id:
+                posts.append({"url": url, "error": "Invalid Reddit URL"})
+            elif info is None:
+                posts.append({"url": url, "error": "Post not found"})
+            else:
+                posts.append({"url": url, "title": info['title'], "numComments": info['num_comments']})
+        return jsonify({"posts": posts})
+
+    except Exception as e:
+        logger.error(f"Error fetching post info: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -0,0 +1,300 @@
+"""Offline benchmark of the phrase pipeline on recorded or synthetic comment dumps.
+
+Each fixture runs in a fresh process through the three stages of /api/top_phrases after the
+fetch: clean, extract (extract_filtered_phrases) and score (top_phrases_combined). The clean_loop
+stage cleans the same comments one clean_text call at a time, for comparison with the batched
+clean_texts of the clean stage; its output is not used. For each stage
+the report shows the median and best wall time, the process's peak RSS once the stage is done,
+and the peak of memory allocated during the stage as seen by tracemalloc.
+
+    python benchmarks/bench.py                      # run and compare with benchmarks/baseline.json
+    python benchmarks/bench.py --save-baseline      # run and store the results as the new baseline
+    python benchmarks/bench.py record NAME URL...   # record threads from Reddit as fixture NAME
+
+--api runs the pipeline of another checkout's api directory, e.g. a git worktree of the base
+branch, so its baseline can be saved and compared with; trees from before clean_texts,
+CommentBatch or TokenCache are driven through the per-comment API they had instead.
+
+Recorded fixtures (benchmarks/fixtures/NAME.json.gz) take the place of the synthetic fixture of
+the same name. Timings depend on the machine, so save the baseline and compare on the same one.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import statistics
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+API_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'api')
+
+STAGES = ['clean_loop', 'clean', 'extract', 'score']
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.15
+PIPELINE_PARAMS = {'min_ngram': 1, 'max_ngram': 5, 'top_n': 10, 'apply_remove_lowercase': True}
+
+# name: (comments per thread, number of threads, seed)
+SYNTHETIC_FIXTURES = {
+    'small': (200, 1, 1),
+    'medium': (1500, 1, 2),
+    'large': (5000, 1, 3),
+    'multi': (1250, 4, 4),
+}
+
+FILLER = ("i think that the show was really good and the best part is when they go to the place honestly "
+          "this is my favorite thing ever but also like it a lot because of ending what do you guys "
+          "think about it why so agree with on that watched again last year after first time not sure "
+          "if would recommend anyone who has seen before yeah pretty much exactly same here lol").split()
+ENTITIES = ["Crash Landing on You", "Breaking Bad", "Better Call Saul", "The Last of Us", "Game of Thrones",
+            "Season 2", "Part II", "Elden Ring", "Dark Souls III", "Dark Souls 3", "Red Dead Redemption 2",
+            "New York City", "Walter White", "Jesse Pinkman", "Rick and Morty", "Star Wars", "The Mandalorian",
+            "Lord of the Rings", "Final Fantasy VII", "Final Fantasy 7", "Attack on Titan", "One Piece",
+            "Studio Ghibli", "Spirited Away", "Mad Men", "The Wire", "Hollow Knight", "Baldur's Gate 3",
+            "Mass Effect 2", "Twin Peaks", "Succession", "The Sopranos", "Cowboy Bebop", "Fullmetal Alchemist"]
+DECORATIONS = [" https://www.example.com/watch?v=abc123&t=42", "!!!", " (edit: typo)", " -- idk", "...",
+               " it's", " don't", " 10/10", " — so good", " \U0001f602", "\n\nEdit: thanks for the gold"]
+
+def synthetic_threads(comments_per_thread, num_threads, seed):
+    """Deterministic threads of comments mixing filler text, Zipf-distributed entities and noise."""
+    rng = random.Random(seed)
+    entity_weights = [1 / (rank + 1) for rank in range(len(ENTITIES))]
+    threads = []
+    for thread in range(num_threads):
+        # Each thread leans on its own slice of the entities, as different threads would
+        entities = ENTITIES[thread * 5:] + ENTITIES[:thread * 5]
+        comments = []
+        for index in range(comments_per_thread):
+            parts = []
+            for _ in range(max(1, int(rng.lognormvariate(0.6, 0.7)))):
+                parts.append(' '.join(rng.choice(FILLER) for _ in range(rng.randint(3, 18))))
+                if rng.random() < 0.6:
+                    parts.append(rng.choices(entities, entity_weights)[0])
+                if rng.random() < 0.15:
+                    parts.append(rng.choice(DECORATIONS))
+            text = ' '.join(parts)
+            comments.append({
+                'id': f't{thread}c{index}',
+                'text': text[0].upper() + text[1:],
+                'score': min(int(rng.paretovariate(1.2)) - 1, 20000),
+                'created_utc': 1700000000.0 + index * 37
+            })
+        threads.append(comments)
+    return threads
+
+def fixture_path(name):
+    return os.path.join(FIXTURES_DIR, f'{name}.json.gz')
+
+def fixture_names():
+    recorded = [name[:-len('.json.gz')] for name in sorted(os.listdir(FIXTURES_DIR))
+                if name.endswith('.json.gz')] if os.path.isdir(FIXTURES_DIR) else []
+    return list(SYNTHETIC_FIXTURES) + [name for name in recorded if name not in SYNTHETIC_FIXTURES]
+
+def load_fixture(name):
+    """Return (threads of comment records, 'recorded' or 'synthetic')."""
+    if os.path.exists(fixture_path(name)):
+        with gzip.open(fixture_path(name), 'rt', encoding='utf-8') as f:
+            return [thread['comments'] for thread in json.load(f)['threads']], 'recorded'
+    return synthetic_threads(*SYNTHETIC_FIXTURES[name]), 'synthetic'
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+
+@contextmanager
+def measured(measurements, stage, trace):
+    """Store the seconds spent in the block, or with trace the most bytes it had allocated at once."""
+    if trace:
+        # Tracing from scratch leaves out whatever earlier stages still hold
+        tracemalloc.start()
+    start = time.perf_counter()
+    yield
+    if trace:
+        measurements[stage] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        measurements[stage] = time.perf_counter() - start
+
+def load_comments(index, threads):
+    """The comments of threads as the pipeline takes them: a CommentBatch, or a list of records."""
+    if hasattr(index, 'CommentBatch'):
+        return index.CommentBatch.concat([index.CommentBatch.from_records(thread) for thread in threads])
+    return [comment for thread in threads for comment in thread]
+
+def clean_comments(index, raw):
+    """Clean raw like the handler does, with clean_texts where the tree has it."""
+    texts = raw.texts() if hasattr(raw, 'texts') else [comment['text'] for comment in raw]
+    if hasattr(index, 'clean_texts'):
+        texts = index.clean_texts(texts)
+    else:
+        texts = [index.clean_text(text) for text in texts]
+    if hasattr(raw, 'with_texts'):
+        return raw.with_texts(texts)
+    return [{**comment, 'text': text} for comment, text in zip(raw, texts)]
+
+def reset_token_cache(index):
+    """Drop tokenized comments, so every run starts like a new process does."""
+    if hasattr(index, 'TokenCache'):
+        index.token_cache = index.TokenCache()
+    elif hasattr(index.tokenize_and_filter, 'cache_clear'):
+        index.tokenize_and_filter.cache_clear()
+
+def run_pipeline(index, raw, trace=False):
+    """Run the stages once, returning ({stage: measurement}, top phrases)."""
+    measurements = {}
+    with measured(measurements, 'clean_loop', trace):
+        texts = raw.texts() if hasattr(raw, 'texts') else [comment['text'] for comment in raw]
+        [index.clean_text(text) for text in texts]
+    with measured(measurements, 'clean', trace):
+        comments = clean_comments(index, raw)
+    with measured(measurements, 'extract', trace):
+        phrases = index.extract_filtered_phrases(comments, **PIPELINE_PARAMS)
+    with measured(measurements, 'score', trace):
+        top = index.top_phrases_combined(phrases, comments, top_n=PIPELINE_PARAMS['top_n'],
+                                         min_length=PIPELINE_PARAMS['min_ngram'], max_length=PIPELINE_PARAMS['max_ngram'])
+    return measurements, top
+
+def measure_fixture(name, repeat, api_dir=API_DIR):
+    """Benchmark one fixture; runs in its own process so peak RSS belongs to this fixture alone."""
+    sys.path.insert(0, api_dir)
+    # The pipeline never touches Reddit here, so the API client only needs to be constructible
+    os.environ.setdefault('REDDIT_CLIENT_ID', 'benchmark')
+    os.environ.setdefault('REDDIT_CLIENT_SECRET', 'benchmark')
+    os.environ.setdefault('COMMENT_CACHE_ENABLED', '0')
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    import logging
+    logging.disable(logging.CRITICAL)
+    import index
+
+    threads, source = load_fixture(name)
+    raw = load_comments(index, threads)
+    stages = {stage: {'times': []} for stage in STAGES}
+    top = None
+    for run in range(repeat):
+        reset_token_cache(index)
+        timings, top = run_pipeline(index, raw)
+        for stage in STAGES:
+            stages[stage]['times'].append(timings[stage])
+            if run == 0:
+                stages[stage]['peak_rss_mb'] = peak_rss_mb()
+
+    reset_token_cache(index)
+    allocated, _ = run_pipeline(index, raw, trace=True)
+
+    for stage in STAGES:
+        times = stages[stage].pop('times')
+        stages[stage].update(
+            median_ms=statistics.median(times) * 1000,
+            best_ms=min(times) * 1000,
+            alloc_peak_mb=allocated[stage] / 1024 / 1024
+        )
+    return {
+        'source': source,
+        'threads': len(threads),
+        'comments': len(raw),
+        'stages': stages,
+        'top_phrases': [phrase for phrase, _, _ in top]
+    }
+
+def run(names, repeat, api_dir=API_DIR):
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(measure_fixture, name, repeat, api_dir).result()
+    return results
+
+def report(results, baseline, tolerance):
+    """Print one row per fixture and stage; return the stages slower than the baseline allows."""
+    regressions = []
+    print(f"{'fixture':<10} {'stage':<10} {'median ms':>10} {'best ms':>9} {'peak RSS MB':>12} {'alloc MB':>9}  vs baseline")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        for stage in STAGES:
+            stats = result['stages'][stage]
+            change = ''
+            if previous and stage in previous['stages']:
+                # Best times are the least disturbed by other load on the machine
+                ratio = stats['best_ms'] / max(previous['stages'][stage]['best_ms'], 1e-6)
+                change = f'{(ratio - 1) * 100:+.1f}%'
+                if ratio > 1 + tolerance:
+                    change += '  REGRESSION'
+                    regressions.append(f'{name}/{stage}')
+            print(f"{name:<10} {stage:<10} {stats['median_ms']:>10.1f} {stats['best_ms']:>9.1f} "
+                  f"{stats['peak_rss_mb']:>12.1f} {stats['alloc_peak_mb']:>9.1f}  {change}")
+        print(f"{'':<10} {result['comments']} {result['source']} comments in {result['threads']} thread(s)")
+        if previous and previous['top_phrases'] != result['top_phrases']:
+            print(f"{'':<10} top phrases differ from the baseline: {result['top_phrases']}")
+    return regressions
+
+def record(name, urls, max_comments):
+    """Fetch urls through the live pipeline and store their comments as fixture name."""
+    sys.path.insert(0, API_DIR)
+    import index
+    threads = []
+    for url in urls:
+        data = index.get_reddit_data(url, max_comments)
+        if not data:
+            sys.exit(f"Could not fetch {url}")
+        threads.append({'url': url, 'comments': data['comments'].to_records()})
+        print(f"Recorded {len(data['comments'])} comments from {url}")
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with gzip.open(fixture_path(name), 'wt', encoding='utf-8') as f:
+        json.dump({'recorded_at': time.time(), 'threads': threads}, f)
+    print(f"Saved fixture {name} to {fixture_path(name)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'record'])
+    parser.add_argument('args', nargs='*', help='record: fixture name followed by thread URLs')
+    parser.add_argument('--fixtures', nargs='+', help='fixtures to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--api', default=API_DIR, help='api directory whose index.py to benchmark')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown of a stage\'s best time before it counts as a regression')
+    parser.add_argument('--max-comments', type=int, default=5000, help='record: comments per thread')
+    options = parser.parse_args()
+
+    if options.command == 'record':
+        if len(options.args) < 2:
+            parser.error('record needs a fixture name and at least one URL')
+        record(options.args[0], options.args[1:], options.max_comments)
+        return
+
+    names = options.fixtures or fixture_names()
+    unknown = [name for name in names if name not in SYNTHETIC_FIXTURES and not os.path.exists(fixture_path(name))]
+    if unknown:
+        parser.error(f"unknown fixtures: {', '.join(unknown)}")
+
+    results = run(names, options.repeat, os.path.abspath(options.api))
+    baseline = {}
+    if os.path.exists(options.baseline) and not options.save_baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, options.tolerance)
+
+    if options.save_baseline:
+        with open(options.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {options.baseline}")
+    elif regressions:
+        print(f"Slower than baseline by more than {options.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
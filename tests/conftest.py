@@ -0,0 +1,10 @@
+import os
+import sys
+
+os.environ.setdefault('REDDIT_CLIENT_ID', 'test')
+os.environ.setdefault('REDDIT_CLIENT_SECRET', 'test')
+os.environ.setdefault('COMMENT_CACHE_ENABLED', '0')
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+os.environ.setdefault('METRICS_ENABLED', '0')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
@@ -0,0 +1,55 @@
+import random
+import string
+
+import index
+from index import ContainmentIndex
+
+
+def random_token(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def test_long_token_without_repeats_is_not_expanded():
+    rng = random.Random(0)
+    token = random_token(rng, 10000)
+    containment = ContainmentIndex()
+    containment.add(f'the {token} show')
+
+    short_substrings = {word[start:end] for word in ('the', 'show')
+                        for start in range(len(word)) for end in range(start + 1, len(word) + 1)}
+    assert set(containment.substrings) == short_substrings
+    assert token[1234:5678] in containment
+    assert token[-40:] in containment
+    assert f'the {token[:50]}' in containment
+    assert token[:100][::-1] not in containment
+
+    containment.remove(f'the {token} show')
+    assert token[1234:5678] not in containment
+    assert not containment.long_tokens
+
+
+def test_matches_plain_substring_scan():
+    rng = random.Random(1)
+    phrases = [' '.join(random_token(rng, rng.choice([2, 5, 40, 120])) for _ in range(rng.randint(1, 3)))
+               for _ in range(40)]
+    containment = ContainmentIndex()
+    for phrase in phrases:
+        containment.add(phrase)
+    for phrase in phrases[::3]:
+        containment.remove(phrase)
+    kept = [phrase for i, phrase in enumerate(phrases) if i % 3]
+
+    queries = [phrase[start:start + length] for phrase in phrases
+               for start, length in [(0, 3), (2, 30), (1, 60)]]
+    queries += [random_token(rng, 2) for _ in range(200)]
+    for query in queries:
+        assert (query in containment) == any(query in phrase for phrase in kept), query
+
+
+def test_long_repeated_token_is_selected():
+    rng = random.Random(2)
+    token = 'Z' + random_token(rng, 1999)
+    comments = [{'text': f'I love {token} so much', 'score': 3} for _ in range(3)]
+    phrases = index.extract_filtered_phrases(comments, min_ngram=1, max_ngram=5, top_n=10,
+                                             apply_remove_lowercase=True, custom_words=set())
+    assert token in phrases
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import index
+from index import AsyncRedditClient, CommentCache, CommentTree, RateLimitScheduler, ResultCache
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'reddit_thread.json')
+THREAD_URL = 'https://www.reddit.com/r/books/comments/abc123/best_science_fiction_novel/'
+
+
+class RedditStub:
+    """Serves the recorded responses of fixtures/reddit_thread.json like Reddit's JSON API.
+
+    The first rate_limited requests are answered with a 429, and every response waits delay seconds.
+    """
+
+    def __init__(self, recorded):
+        self.recorded = recorded
+        self.requests = []
+        self.rate_limited = 0
+        self.retry_after = '0.2'
+        self.delay = 0
+
+    async def respond(self, request, payload):
+        self.requests.append((request.path, dict(request.query)))
+        await asyncio.sleep(self.delay)
+        if self.rate_limited:
+            self.rate_limited -= 1
+            return web.json_response({'error': 429}, status=429, headers={'Retry-After': self.retry_after})
+        return web.json_response(payload)
+
+    async def comments(self, request):
+        sort = request.query.get('sort')
+        return await self.respond(request, self.recorded['comments_new' if sort == 'new' else 'comments_top'])
+
+    async def morechildren(self, request):
+        children = request.query['children'].split(',')
+        payload = self.recorded['morechildren']
+        things = [thing for thing in payload['json']['data']['things'] if thing['data']['id'] in children]
+        return await self.respond(request, {'json': {'errors': [], 'data': {'things': things}}})
+
+
+@pytest.fixture
+def reddit(monkeypatch):
+    """A RedditStub listening on a local port, with index.reddit_client pointed at it."""
+    with open(FIXTURE_PATH, encoding='utf-8') as f:
+        stub = RedditStub(json.load(f))
+    app = web.Application()
+    app.router.add_get('/comments/{submission_id}', stub.comments)
+    app.router.add_get('/api/morechildren', stub.morechildren)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    host, port = runner.addresses[0][:2]
+    monkeypatch.setattr(index, 'reddit_client', AsyncRedditClient(
+        None, None, base_url=f'http://{host}:{port}', scheduler=RateLimitScheduler(requests_per_minute=6000)
+    ))
+    monkeypatch.setattr(index, 'post_info_cache', ResultCache())
+    monkeypatch.setattr(index, 'comment_cache', None)
+    yield stub
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def run(coro):
+    """Run coro on a fresh event loop, closing the client session it opened."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await index.reddit_client.close()
+    return asyncio.run(main())
+
+
+async def load_tree():
+    submission, things = await index.reddit_client.get_comments('abc123', 'top', index.COMMENT_PAGE_LIMIT)
+    tree = CommentTree(submission['name'])
+    tree.add(things)
+    return tree
+
+
+def test_full_fetch_expands_more_and_filters_comments(reddit):
+    data = run(index.fetch_reddit_data_async(THREAD_URL))
+    assert data['comments'].ids() == ['c1', 'c2', 'c6', 'c7', 'c8', 'c4']
+    assert list(data['comments'].scores) == [120, 80, 30, 25, 12, 40]
+    assert data['unexpanded'] == 0
+    assert [path for path, _ in reddit.requests] == ['/comments/abc123', '/api/morechildren']
+    assert reddit.requests[1][1]['children'] == 'c6,c7,c8'
+
+
+def test_more_expansion_stops_at_request_budget(reddit, monkeypatch):
+    monkeypatch.setattr(index, 'MORECHILDREN_BATCH_SIZE', 1)
+
+    async def expand():
+        tree = await load_tree()
+        unexpanded = await index.expand_more_comments(tree, 'abc123', 'top', max_requests=2)
+        return tree, unexpanded
+
+    tree, unexpanded = run(expand())
+    assert unexpanded == 1
+    assert [comment['id'] for comment in tree.comments()] == ['c1', 'c2', 'c3', 'c5', 'c6', 'c7', 'c4']
+    assert tree.pop_more()['children'] == ['c8']
+
+
+def test_more_expansion_stops_at_time_budget(reddit):
+    async def expand():
+        tree = await load_tree()
+        reddit.delay = 1
+        start = time.monotonic()
+        unexpanded = await index.expand_more_comments(tree, 'abc123', 'top', time_budget=0.1)
+        return tree, unexpanded, time.monotonic() - start
+
+    tree, unexpanded, elapsed = run(expand())
+    assert elapsed < 0.9
+    # The cancelled request's stub is kept for a later expansion
+    assert unexpanded == 3
+    assert 'c6' not in {comment['id'] for comment in tree.comments()}
+
+
+def test_rate_limited_request_backs_off_and_retries(reddit):
+    reddit.rate_limited = 1
+    start = time.monotonic()
+    submission, things = run(index.reddit_client.get_comments('abc123', 'top', index.COMMENT_PAGE_LIMIT))
+    assert time.monotonic() - start >= 0.2
+    assert submission['id'] == 'abc123'
+    assert len(reddit.requests) == 2
+
+
+def test_rate_limited_request_gives_up_after_retries(reddit, monkeypatch):
+    monkeypatch.setattr(index, 'REDDIT_MAX_RETRIES', 1)
+    reddit.rate_limited = 2
+    reddit.retry_after = '0.05'
+    with pytest.raises(aiohttp.ClientResponseError) as excinfo:
+        run(index.reddit_client.get_comments('abc123', 'top', index.COMMENT_PAGE_LIMIT))
+    assert excinfo.value.status == 429
+    assert len(reddit.requests) == 2
+
+
+def test_stale_snapshot_is_refreshed_incrementally(reddit, tmp_path, monkeypatch):
+    cache = CommentCache(str(tmp_path / 'comments.sqlite3'))
+    monkeypatch.setattr(index, 'comment_cache', cache)
+    monkeypatch.setattr(index, 'COMMENT_CACHE_MIN_DELTA', 0)
+    run(index.fetch_reddit_data_async(THREAD_URL))
+    with cache._connect() as conn:
+        conn.execute("UPDATE comments SET fetched_at = 0")
+    # The thread's post info has expired too, so the snapshot is revalidated against Reddit
+    monkeypatch.setattr(index, 'post_info_cache', ResultCache())
+    reddit.requests.clear()
+
+    data = run(index.fetch_reddit_data_async(THREAD_URL))
+    assert data['comments'].ids() == ['c1', 'c2', 'c6', 'c7', 'c8', 'c4', 'c10', 'c9']
+    assert data['comments'].scores[1] == 95
+    assert reddit.requests == [('/comments/abc123', {'sort': 'new', 'limit': str(index.INCREMENTAL_COMMENT_LIMIT),
+                                                     'raw_json': '1'})]
+    assert cache.incremental == 1
+    snapshot = cache.get('abc123')
+    assert snapshot['num_comments'] == 10
+    assert data['version'] == snapshot['stored_at']
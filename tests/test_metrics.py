@@ -0,0 +1,28 @@
+import index
+
+
+def test_summarize_metrics_skips_malformed_rows():
+    rows = [
+        {'status': 'ok', 'total_time': '0.5', 'total_comments': '100'},
+        {'status': 'ok', 'total_time': '1.5', 'total_comments': 'abc'},
+        {'status': 'error', 'total_time': 'nan'},
+        {'status': None, 'total_time': None},
+        {'status': 'ok', 'total_time': ''},
+    ]
+    summary = index.summarize_metrics(rows)
+    assert summary['total_time'] == {'p50': 0.5, 'p90': 1.5, 'p99': 1.5, 'max': 1.5}
+    assert summary['total_comments']['max'] == 100
+
+
+def test_metrics_endpoint_survives_partial_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, 'STATS_FILE', str(tmp_path / 'performance_metrics.csv'))
+    monkeypatch.setattr(index, 'METRICS_ENABLED', True)
+    index.log_performance_metrics({'timestamp': '1', 'status': 'ok', 'total_time': '0.25'})
+    with open(index.STATS_FILE, 'a') as f:
+        f.write('2,ok,oops\n3\n')
+
+    response = index.app.test_client().get('/api/metrics')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['requests'] == 3
+    assert body['metrics']['total_time']['max'] == 0.25
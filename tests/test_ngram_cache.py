@@ -0,0 +1,42 @@
+import index
+from index import CommentBatch, PhraseCounter, ThreadCountCache
+
+
+def make_batch(texts, prefix):
+    texts = [index.clean_text(text) for text in texts]
+    return CommentBatch(texts, [5] * len(texts), [f'{prefix}{i}' for i in range(len(texts))], [0.0] * len(texts))
+
+
+def count_directly(batch, **params):
+    counter = PhraseCounter(**params)
+    counter.add(batch)
+    return counter
+
+
+def test_cached_counts_match_direct_counts():
+    batch = make_batch(['I loved Breaking Bad and Better Call Saul', 'Breaking Bad Season 2 was great',
+                        'Better Call Saul is better than Breaking Bad'] * 3, 'a')
+    cache = ThreadCountCache()
+    for params in [dict(min_ngram=1, max_ngram=5), dict(min_ngram=2, max_ngram=3, custom_words={'saul'}),
+                   dict(min_ngram=1, max_ngram=5, apply_remove_lowercase=False)]:
+        counter = PhraseCounter(**params)
+        cache.add_to(counter, 'a', batch)
+        assert counter.phrases() == count_directly(batch, **params).phrases()
+    assert cache.stats()['misses'] == 2
+
+
+def test_thread_larger_than_the_cache_is_not_kept():
+    small = make_batch(['Breaking Bad is great'] * 2, 's')
+    large = make_batch([f'Word{i} Other{i} Thing{i} Stuff{i} and More{i}' for i in range(200)], 'l')
+    cache = ThreadCountCache(max_ngrams=100)
+
+    cache.add_to(PhraseCounter(apply_remove_lowercase=False), 's', small)
+    assert cache.stats()['threads'] == 1
+
+    counter = PhraseCounter(apply_remove_lowercase=False)
+    cache.add_to(counter, 'l', large)
+    assert counter.phrases() == count_directly(large, apply_remove_lowercase=False).phrases()
+    stats = cache.stats()
+    assert stats['ngrams'] <= 100
+    assert ('l', False) not in cache.entries
+    assert ('s', False) in cache.entries
@@ -0,0 +1,144 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+import index
+from index import PhraseCounter
+
+NAMES = ['Crash Landing on You', 'Breaking Bad', 'Better Call Saul', 'The Last of Us', 'Season 2',
+         'Part II', 'Dark Souls III', 'Dark Souls 3', 'Elden Ring', 'Red Dead Redemption 2',
+         'Walter White', 'Final Fantasy VII', 'Final Fantasy 7', 'Attack on Titan', 'Star Wars',
+         'Studio Ghibli', 'Witcher', 'NASA', 'PS5']
+WORDS = ('i think that the show was really good and the best part is when they go to the place '
+         'honestly this is my favorite thing ever but I also like it a lot because of the ending '
+         'what do you guys think about it and why is it so good Yeah I agree with you on that').split()
+
+
+def make_comments(n, seed):
+    rng = random.Random(seed)
+    comments = []
+    for _ in range(n):
+        parts = []
+        for _ in range(rng.randint(1, 4)):
+            parts.append(' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 12))))
+            if rng.random() < 0.7:
+                parts.append(rng.choice(NAMES))
+        comments.append({'text': index.clean_text(' '.join(parts)), 'score': rng.randint(-3, 500)})
+    return comments
+
+
+def reference_select_common_phrases(counter, comments, top_n):
+    """The selection loop of extract_filtered_phrases before this series, verbatim but for logging."""
+    ngram_counts, normalized_to_original = counter.phrases()
+    ngram_counts = Counter(ngram_counts)
+
+    sorted_phrases = sorted(ngram_counts.items(), key=lambda x: len(x[0].split()), reverse=True)
+
+    min_occurrences = min(30, max(math.ceil(len(comments) / 40), 2))
+    all_common_phrases = set()
+    all_common_phrases_lower = set()
+
+    while min_occurrences >= 2 and len(all_common_phrases) < top_n:
+        filtered_phrases = []
+
+        for phrase_lower, count in sorted_phrases:
+            if count >= min_occurrences and phrase_lower not in all_common_phrases_lower:
+                phrase = normalized_to_original[phrase_lower]
+                if ' ' in phrase:
+                    filtered_phrases.append(phrase)
+
+        for phrase_lower, count in sorted_phrases:
+            if count >= min_occurrences and phrase_lower not in all_common_phrases_lower:
+                phrase = normalized_to_original[phrase_lower]
+                if ' ' not in phrase:
+                    if not any(phrase_lower in p.lower() for p in filtered_phrases) and \
+                       not any(phrase_lower in p.lower() for p in all_common_phrases):
+                        filtered_phrases.append(phrase)
+
+        if not filtered_phrases:
+            min_occurrences -= 1
+            continue
+
+        filtered_phrases_sorted = sorted(
+            filtered_phrases,
+            key=lambda phrase: ngram_counts[phrase.lower()],
+            reverse=True
+        )
+
+        for phrase in filtered_phrases_sorted:
+            phrase_lower = phrase.lower()
+
+            phrases_to_remove = set()
+            skip_current = False
+
+            for existing in all_common_phrases:
+                existing_lower = existing.lower()
+
+                if existing_lower in phrase_lower or phrase_lower in existing_lower:
+                    if len(phrase_lower.split()) > len(existing_lower.split()):
+                        phrases_to_remove.add(existing)
+                        all_common_phrases_lower.remove(existing_lower)
+                    else:
+                        skip_current = True
+                        break
+
+            if skip_current:
+                continue
+
+            all_common_phrases.difference_update(phrases_to_remove)
+
+            if len(all_common_phrases) < top_n or phrases_to_remove:
+                all_common_phrases.add(phrase)
+                all_common_phrases_lower.add(phrase_lower)
+
+        min_occurrences -= 1
+
+    if not all_common_phrases:
+        all_words = set()
+        for comment in comments:
+            all_words.update(comment['text'].split())
+        all_common_phrases = set(list(all_words)[:top_n])
+
+    top_phrases = sorted(
+        all_common_phrases,
+        key=lambda phrase: ngram_counts[phrase.lower()],
+        reverse=True
+    )[:top_n]
+
+    return top_phrases
+
+
+@pytest.mark.parametrize('num_comments,seed', [(60, 1), (400, 2), (1500, 3)])
+@pytest.mark.parametrize('min_ngram,max_ngram', [(1, 5), (2, 3), (1, 1), (3, 5)])
+@pytest.mark.parametrize('apply_remove_lowercase', [True, False])
+@pytest.mark.parametrize('top_n', [1, 3, 10, 40])
+def test_matches_reference_selection(num_comments, seed, min_ngram, max_ngram, apply_remove_lowercase, top_n):
+    comments = make_comments(num_comments, seed)
+    counter = PhraseCounter(min_ngram, max_ngram, apply_remove_lowercase)
+    counter.add(comments)
+    expected = reference_select_common_phrases(counter, comments, top_n)
+    selected = index.select_common_phrases(counter, comments, top_n)
+    ngram_counts, _ = counter.phrases()
+    # Phrases with equal counts came out in set order before, so only compare the counts' order
+    assert sorted(selected) == sorted(expected)
+    assert [ngram_counts[phrase.lower()] for phrase in selected] == \
+        [ngram_counts[phrase.lower()] for phrase in expected]
+
+
+@pytest.mark.parametrize('top_n', [1, 3, 100])
+def test_falls_back_to_words_like_reference(top_n):
+    # No phrase repeats, so nothing reaches two occurrences
+    comments = [{'text': f'Alpha{i} beta{i} Gamma{i}', 'score': 1} for i in range(5)]
+    counter = PhraseCounter(1, 5, False)
+    counter.add(comments)
+    expected = reference_select_common_phrases(counter, comments, top_n)
+    selected = index.select_common_phrases(counter, comments, top_n)
+
+    all_words = {word for comment in comments for word in comment['text'].split()}
+    # The reference picks any top_n words (set order); the current code picks the first ones seen
+    assert len(selected) == len(expected) == min(top_n, len(all_words))
+    assert set(selected) <= all_words
+    first_words = list(dict.fromkeys(word for comment in comments for word in comment['text'].split()))
+    assert set(selected) == set(first_words[:top_n])
@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+
+import pytest
+
+import index
+from index import CommentBatch, PhraseCounter
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'comments.json')
+
+
+@pytest.fixture(scope='module')
+def comments():
+    with open(FIXTURE_PATH, encoding='utf-8') as f:
+        texts = [index.clean_text(text) for text in json.load(f)] * 6
+    return CommentBatch(texts, [i % 50 for i in range(len(texts))], [str(i) for i in range(len(texts))],
+                        [0.0] * len(texts))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(index, 'EXTRACT_WORKERS', 2)
+    monkeypatch.setattr(index, 'SHARD_MIN_COMMENTS', 10)
+    monkeypatch.setattr(index, '_extract_pool', None)
+    pool = index.get_extract_pool()
+    yield pool
+    pool.shutdown()
+
+
+def test_count_phrase_shard_matches_in_process_counting(comments):
+    texts = comments.texts()
+    tokens, stats, count_error = index.count_phrase_shard(texts, 0, 1, 5, True, None)
+    counter = PhraseCounter(1, 5, True)
+    counter.add(comments)
+    assert count_error == 0
+    assert stats == {key: entry for key, entry in counter.stats.items() if entry}
+    assert tokens == counter.tokens
+
+
+@pytest.mark.parametrize('params', [dict(min_ngram=1, max_ngram=5),
+                                    dict(min_ngram=2, max_ngram=3, custom_words={'bad'}),
+                                    dict(apply_remove_lowercase=False)])
+def test_sharded_counting_matches_in_process_counting(comments, pool, caplog, params):
+    expected = PhraseCounter(**params)
+    expected.count(comments)
+
+    sharded = PhraseCounter(**params)
+    sharded.add_sharded(comments, pool)
+    assert sharded.phrases() == expected.phrases()
+
+    with caplog.at_level(logging.WARNING, logger='index'):
+        counter = PhraseCounter(**params)
+        counter.add(comments)
+    assert counter.phrases() == expected.phrases()
+    assert not [record for record in caplog.records if 'failed' in record.getMessage()]
+
+
+def test_sharded_scoring_matches_in_process_scoring(comments, pool, caplog):
+    phrases = sorted(index.extract_filtered_phrases(comments, top_n=20))
+    with caplog.at_level(logging.WARNING, logger='index'):
+        sharded = index.compute_phrase_scores_numpy(phrases, comments, [0.1, 1.0], pool)
+    assert sharded == index.compute_phrase_scores_numpy(phrases, comments, [0.1, 1.0])
+    assert sharded[1]
+    assert not [record for record in caplog.records if 'failed' in record.getMessage()]
+
+
+def test_python_backend_scores_every_alpha_in_one_pass(comments, pool, monkeypatch):
+    monkeypatch.setattr(index, 'SCORING_BACKEND', 'python')
+    monkeypatch.setattr(index, 'compute_phrase_scores_numpy', None)
+    phrases = sorted(index.extract_filtered_phrases(comments, top_n=20))
+    scores_by_alpha, total_upvotes = index.compute_phrase_index_scores_multi(phrases, comments, [0.1, 1.0])
+    for alpha, phrase_scores in zip([0.1, 1.0], scores_by_alpha):
+        assert (phrase_scores, total_upvotes) == index.compute_phrase_index_scores(phrases, comments, alpha)
+    assert scores_by_alpha[1]
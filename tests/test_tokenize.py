@@ -0,0 +1,38 @@
+import itertools
+import json
+import os
+
+import pytest
+from nltk.tokenize import word_tokenize
+
+import index
+from index import clean_text, split_tokenize
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'comments.json')
+
+with open(FIXTURE_PATH, encoding='utf-8') as f:
+    COMMENTS = json.load(f)
+
+
+@pytest.mark.parametrize('comment', COMMENTS)
+def test_split_tokenize_matches_word_tokenize_on_cleaned_comments(comment):
+    text = clean_text(comment)
+    assert split_tokenize(text) == word_tokenize(text)
+    assert index.tokenize(text) == tuple(word_tokenize(text))
+
+
+@pytest.mark.parametrize('comment', COMMENTS)
+def test_tokenize_falls_back_to_word_tokenize_on_raw_comments(comment):
+    assert index.tokenize(comment) == tuple(word_tokenize(comment))
+
+
+def test_contractions_in_every_casing():
+    words = []
+    for word in index.CONTRACTION_SPLITS:
+        words += [''.join(chars) for chars in itertools.product(*((c.lower(), c.upper()) for c in word))]
+    for size in (1, 2, 3):
+        text = ' '.join(words[i % len(words)] for i in range(0, len(words) * size, size))
+        assert split_tokenize(text) == word_tokenize(text)
+    for word in words:
+        for text in (word, f'I {word} do it', f'{word}s', f'x{word}'):
+            assert split_tokenize(text) == word_tokenize(text), text